@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from datetime import timedelta
@@ -33,6 +33,7 @@ class UserResponse(BaseModel):
 
 # Security
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 router = APIRouter()
 
 def get_user_by_username_or_email(db: Session, username_or_email: str):
@@ -50,11 +51,8 @@ def authenticate_user(db: Session, username_or_email: str, password: str):
         return False
     return user
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-):
-    """Get current authenticated user."""
+def get_user_from_token(db: Session, token: str):
+    """Resolve a bearer token to its user or raise 401."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -62,7 +60,7 @@ async def get_current_user(
     )
     
     try:
-        payload = verify_token(credentials.credentials)
+        payload = verify_token(token)
         if payload is None:
             raise credentials_exception
         username: str = payload.get("sub")
@@ -76,6 +74,33 @@ async def get_current_user(
         raise credentials_exception
     return user
 
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """Get current authenticated user."""
+    return get_user_from_token(db, credentials.credentials)
+
+async def get_stream_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    token: Optional[str] = Query(None, description="Bearer token, for EventSource clients that cannot set headers"),
+    db: Session = Depends(get_db)
+):
+    """Admin or manager for event streams; accepts the token as a query parameter too."""
+    if credentials is None and token is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = get_user_from_token(db, credentials.credentials if credentials else token)
+    if user.role not in ["admin", "manager"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied. Required roles: ['admin', 'manager']"
+        )
+    return user
+
 def require_role(allowed_roles: list):
     """Decorator to require specific roles for endpoint access."""
     def role_checker(current_user: User = Depends(get_current_user)):
@@ -3,10 +3,11 @@ from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
 
-from ..db.database import get_db
+from ..db.database import get_db, get_read_db
 from ..models.category import Category
 from ..api.auth import get_current_user
 from ..models.user import User
+from ..core.serialization import FastJSONResponse, CATEGORY_COLUMNS, serialize_categories
 
 # Pydantic models
 class CategoryCreate(BaseModel):
@@ -44,20 +45,12 @@ def check_write_access(current_user: User):
 
 @router.get("/", response_model=List[CategoryResponse])
 async def get_categories(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get all categories."""
-    categories = db.query(Category).all()
-    return [
-        CategoryResponse(
-            id=cat.id,
-            name=cat.name,
-            created_at=cat.created_at.isoformat() if cat.created_at else "",
-            updated_at=cat.updated_at.isoformat() if cat.updated_at else None
-        )
-        for cat in categories
-    ]
+    categories = db.query(Category).with_entities(*CATEGORY_COLUMNS).all()
+    return FastJSONResponse(serialize_categories(categories))
 
 @router.get("/{category_id}", response_model=CategoryResponse)
 async def get_category(
@@ -1,13 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks, Query
 from sqlalchemy.orm import Session
-from pydantic import BaseModel, validator
-from typing import List, Optional
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from pydantic import BaseModel, validator, ValidationError
+from typing import List, Optional, Dict, Any
 
-from ..db.database import get_db
+from ..db.database import get_db, get_read_db
 from ..models.customer import Customer
+from ..models.sales import ArchivedSale
 from ..api.auth import get_current_user
 from ..models.user import User
 from ..utils.sms import sms_service
+from ..core.performance import chunked, ResponseOptimizer
+from ..core.serialization import FastJSONResponse, CUSTOMER_COLUMNS, CUSTOMER_COMPACT_COLUMNS, serialize_customers, check_response_format
+from ..models.ledger import BalanceLedger
+from ..services.balance import record_balance_entry, adjust_balance
+from ..services.statement import build_statement
 
 # Pydantic models
 class CustomerCreate(BaseModel):
@@ -64,8 +72,20 @@ class CustomerResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class CustomerBulkCreate(BaseModel):
+    customers: List[Dict[str, Any]]
+    send_welcome_sms: bool = True
+
+class BulkCustomerResponse(BaseModel):
+    created_count: int
+    failed_count: int
+    results: List[dict]  # [{"row": int, "status": str, "customer_id": int, "error": str}]
+
 router = APIRouter()
 
+# Maximum number of customers accepted by a single bulk onboarding request
+BULK_MAX_ROWS = 5000
+
 def check_write_access(current_user: User):
     """Check if user can write (create/update/delete)"""
     if current_user.role == "salesman":
@@ -94,26 +114,160 @@ def check_low_balance_alert(customer: Customer):
 
 @router.get("/", response_model=List[CustomerResponse])
 async def get_customers(
+    response_format: str = Query("full", alias="format"),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get all customers. Pass format=compact for a columnar payload."""
+    check_response_format(response_format)
+    
+    if response_format == "compact":
+        customers = db.query(Customer).with_entities(*CUSTOMER_COMPACT_COLUMNS).all()
+        return FastJSONResponse(ResponseOptimizer.compress_customer_data(customers))
+    
+    customers = db.query(Customer).with_entities(*CUSTOMER_COLUMNS).all()
+    return FastJSONResponse(serialize_customers(customers))
+
+@router.post("/bulk", response_model=BulkCustomerResponse, status_code=status.HTTP_201_CREATED)
+async def bulk_create_customers(
+    bulk_request: CustomerBulkCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all customers."""
-    customers = db.query(Customer).all()
-    return [
-        CustomerResponse(
-            id=cust.id,
-            name=cust.name,
-            phone=cust.phone,
-            rfid_no=cust.rfid_no,
-            card_number=cust.card_number,
-            balance=cust.balance,
-            created_at=cust.created_at.isoformat() if cust.created_at else "",
-            updated_at=cust.updated_at.isoformat() if cust.updated_at else None,
-            # Add card_discount field
-            card_discount=cust.card_discount
+    """Onboard many customers at once.
+
+    Phone, RFID and card number uniqueness is checked for the whole batch with
+    a few IN queries, rows are inserted in chunks in one transaction and the
+    welcome SMS messages are queued as a single background bulk job.
+    """
+    check_write_access(current_user)
+
+    if not bulk_request.customers:
+        raise HTTPException(status_code=400, detail="No customers provided")
+
+    if len(bulk_request.customers) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"Cannot onboard more than {BULK_MAX_ROWS} customers at once")
+
+    unique_fields = (
+        ("phone", "phone number"),
+        ("rfid_no", "RFID number"),
+        ("card_number", "card number"),
+    )
+
+    results = []
+    rows = []  # (row_number, CustomerCreate)
+    seen = {field: set() for field, _ in unique_fields}
+
+    for row_number, raw_row in enumerate(bulk_request.customers, start=1):
+        try:
+            row = CustomerCreate(**raw_row)
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors())
+            results.append({"row": row_number, "status": "failed", "error": errors})
+            continue
+
+        if row.card_discount < 0 or row.card_discount > 100:
+            results.append({"row": row_number, "status": "failed", "error": "Card discount must be between 0 and 100"})
+            continue
+
+        duplicate = next((label for field, label in unique_fields if getattr(row, field) in seen[field]), None)
+        if duplicate:
+            results.append({"row": row_number, "status": "conflict", "error": f"Duplicate {duplicate} in upload"})
+            continue
+
+        for field, _ in unique_fields:
+            seen[field].add(getattr(row, field))
+        rows.append((row_number, row))
+
+    # One IN query per unique key (chunked to keep parameter lists bounded)
+    existing = {}
+    for field, _ in unique_fields:
+        column = getattr(Customer, field)
+        values = [getattr(row, field) for _, row in rows]
+        existing[field] = set()
+        for chunk in chunked(values):
+            existing[field].update(value for (value,) in db.query(column).filter(column.in_(chunk)).all())
+
+    to_insert = []
+    for row_number, row in rows:
+        conflict = next((label for field, label in unique_fields if getattr(row, field) in existing[field]), None)
+        if conflict:
+            results.append({"row": row_number, "status": "conflict", "error": f"Customer with this {conflict} already exists"})
+            continue
+        to_insert.append((row_number, row))
+
+    created_ids = {}
+    try:
+        for chunk in chunked(to_insert):
+            db.execute(insert(Customer), [
+                {
+                    "name": row.name,
+                    "phone": row.phone,
+                    "rfid_no": row.rfid_no,
+                    "card_number": row.card_number,
+                    "balance": row.balance,
+                    "card_discount": row.card_discount
+                }
+                for _, row in chunk
+            ])
+        
+        for chunk in chunked([row.card_number for _, row in to_insert]):
+            created_ids.update(
+                (card_number, customer_id)
+                for customer_id, card_number in db.query(Customer.id, Customer.card_number).filter(
+                    Customer.card_number.in_(chunk)
+                ).all()
+            )
+        
+        # Record opening balances in the ledger
+        opening_entries = [
+            {
+                "customer_id": created_ids[row.card_number],
+                "delta": row.balance,
+                "reason": "opening",
+                "balance_after": row.balance
+            }
+            for _, row in to_insert
+            if row.balance
+        ]
+        for chunk in chunked(opening_entries):
+            db.execute(insert(BalanceLedger), chunk)
+        
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Customers were created concurrently with the same phone, RFID or card number. Please retry."
         )
-        for cust in customers
-    ]
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error creating customers: {str(e)}")
+
+    for row_number, row in to_insert:
+        results.append({"row": row_number, "status": "created", "customer_id": created_ids.get(row.card_number)})
+    results.sort(key=lambda result: result["row"])
+
+    # Queue all welcome messages as one bulk SMS job that runs after the response is sent
+    if bulk_request.send_welcome_sms and to_insert:
+        messages = [
+            {
+                "contact": row.phone,
+                "message": f"WELCOME\nCafe D Revenue\nCard: {row.card_number}\nBal: PKR {row.balance:.2f}\nThank you for registering!",
+                "type": "text"
+            }
+            for _, row in to_insert
+        ]
+        background_tasks.add_task(sms_service.send_bulk_sms_batched, messages)
+
+    print(f"👥 Bulk customer onboarding: {len(to_insert)} created, {len(results) - len(to_insert)} failed")
+
+    return BulkCustomerResponse(
+        created_count=len(to_insert),
+        failed_count=len(results) - len(to_insert),
+        results=results
+    )
 
 @router.get("/{customer_id}", response_model=CustomerResponse)
 async def get_customer(
@@ -179,6 +333,12 @@ async def create_customer(
         card_discount=customer.card_discount
     )
     db.add(db_customer)
+    db.flush()
+    
+    # Record the opening balance so the ledger can reconstruct statements
+    if db_customer.balance:
+        record_balance_entry(db, db_customer.id, db_customer.balance, "opening", db_customer.balance)
+    
     db.commit()
     db.refresh(db_customer)
     
@@ -202,6 +362,28 @@ async def create_customer(
         card_discount=db_customer.card_discount
     )
 
+@router.get("/{customer_id}/statement")
+async def get_customer_statement(
+    customer_id: int,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get a customer's card statement: card sales, recharges and adjustments, newest first, with running balance.
+
+    Pass the returned next_cursor to fetch the following page.
+    """
+    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    
+    limit = min(200, max(1, limit))
+    try:
+        return build_statement(db, customer.id, customer.balance or 0.0, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.put("/{customer_id}", response_model=CustomerResponse)
 async def update_customer(
     customer_id: int,
@@ -253,8 +435,10 @@ async def update_customer(
         customer.rfid_no = customer_update.rfid_no
     if customer_update.card_number is not None:
         customer.card_number = customer_update.card_number
-    if customer_update.balance is not None:
-        customer.balance = customer_update.balance
+    if customer_update.balance is not None and customer_update.balance != old_balance:
+        # Applied as a difference in one UPDATE, so a card debit that lands between
+        # reading the customer and this write is kept rather than overwritten
+        adjust_balance(db, customer.id, customer_update.balance - old_balance)
     # Add card_discount field update
     if customer_update.card_discount is not None:
         customer.card_discount = customer_update.card_discount
@@ -290,6 +474,11 @@ async def delete_customer(
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
+    # Live sales are detached through the Sale.customer backref; archived sales have no relationship
+    db.execute(
+        update(ArchivedSale).where(ArchivedSale.customer_id == customer.id).values(customer_id=None)
+        .execution_options(synchronize_session=False)
+    )
     db.delete(customer)
     db.commit()
     
@@ -1,16 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Header
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
+import asyncio
+import json
 
-from ..db.database import get_db
+from ..db.database import get_db, get_read_db
 from ..models.user import User
 from ..models.sales import Sale
 from ..models.customer import Customer
 from ..models.product import Product
-from ..api.auth import get_current_user, get_admin_or_manager_user
+from ..api.auth import get_current_user, get_admin_user, get_admin_or_manager_user, get_stream_user
+from ..services.events import broadcaster
+from ..services.today import today_counters
+from ..services.rollups import get_top_customers, rebuild_customer_lifetime_totals
 
 # Pydantic models for dashboard responses
 class TrendData(BaseModel):
@@ -27,10 +33,21 @@ class CustomerInsight(BaseModel):
 
 router = APIRouter()
 
+# Comment line sent when idle so proxies keep the stream open
+STREAM_KEEPALIVE_SECONDS = 15
+
+def format_sse(event_type: str, data: Any, event_id: Optional[str] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
 @router.get("/trends")
 async def get_dashboard_trends(
     days: int = 30,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_admin_or_manager_user)
 ):
     """Get sales trends for the last N days"""
@@ -64,34 +81,106 @@ async def get_dashboard_trends(
 @router.get("/customers/insights")
 async def get_customer_insights(
     limit: int = 5,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_admin_or_manager_user)
 ):
-    """Get top customer insights"""
+    """Get top customer insights from the maintained lifetime totals"""
     try:
-        # Get top customers by total spent
-        customer_sales = db.query(
-            Customer.id,
-            Customer.name,
-            func.sum(Sale.total_price).label('total_spent'),
-            func.count(Sale.id).label('transaction_count'),
-            func.max(Sale.timestamp).label('last_purchase')
-        ).join(Sale).filter(
-            Sale.is_settled == True
-        ).group_by(Customer.id, Customer.name).order_by(
-            desc('total_spent')
-        ).limit(limit).all()
-        
         insights = []
-        for customer_data in customer_sales:
+        for customer_data in get_top_customers(db, limit):
             insights.append(CustomerInsight(
-                id=customer_data.id,
-                name=customer_data.name,
-                total_spent=float(customer_data.total_spent or 0),
-                transaction_count=customer_data.transaction_count or 0,
-                last_purchase=customer_data.last_purchase.isoformat() if customer_data.last_purchase else ""
+                id=customer_data["id"],
+                name=customer_data["name"],
+                total_spent=customer_data["total_spent"],
+                transaction_count=customer_data["transaction_count"],
+                last_purchase=customer_data["last_purchase_at"].isoformat() if customer_data["last_purchase_at"] else ""
             ))
         
         return insights
     except Exception as e:
-        return []
\ No newline at end of file
+        return []
+
+@router.post("/customers/insights/rebuild")
+async def rebuild_customer_insights(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """Rebuild every customer's lifetime totals from the settled sales (admin only)."""
+    try:
+        customers = rebuild_customer_lifetime_totals(db)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error rebuilding customer totals: {str(e)}")
+    
+    return {"message": "Customer totals rebuilt successfully", "customers": customers}
+
+@router.get("/today")
+async def get_today_totals(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_or_manager_user)
+):
+    """
+    Today's revenue, transaction count, payment split, pending amount and
+    recharges, answered from in-memory counters kept up to date by the sales
+    write paths (reloaded from the database after midnight and periodically)
+    """
+    return today_counters.snapshot(db)
+
+@router.get("/stream")
+async def stream_dashboard(
+    request: Request,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_stream_user)
+):
+    """
+    Server-Sent Events feed for the live dashboard.
+
+    Sends a `snapshot` of today's totals on connect, then `sale_created`,
+    `sale_settled`, `sales_batch_settled` and `recharge` events as they are
+    committed, each carrying the updated totals under `today`. Clients reconnecting with Last-Event-ID get the missed events
+    replayed instead of a new snapshot when this worker still has them; a
+    `resync` event means the client fell behind and should reconnect.
+    EventSource cannot send headers, so the token may be passed as ?token=.
+    """
+    queue = broadcaster.subscribe()
+    replay = broadcaster.events_since(last_event_id) if last_event_id else None
+    try:
+        snapshot = None if replay is not None else today_counters.snapshot(db)
+    except Exception:
+        broadcaster.unsubscribe(queue)
+        raise
+    finally:
+        # Release the connection now; the stream itself never touches the database
+        db.close()
+
+    async def event_stream():
+        try:
+            yield "retry: 5000\n\n"
+            last_seq = 0
+            if replay is None:
+                yield format_sse("snapshot", snapshot)
+            else:
+                for event in replay:
+                    last_seq = event["seq"]
+                    yield format_sse(event["type"], event["data"], event["id"])
+            
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event["seq"] <= last_seq:
+                    continue  # already sent as part of the replay
+                last_seq = event["seq"]
+                yield format_sse(event["type"], event["data"], event["id"])
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
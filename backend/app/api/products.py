@@ -1,17 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends, status, File, UploadFile
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Query
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import List, Optional
-import shutil
+from sqlalchemy import insert, update
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional, Dict
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
 import os
-import time
+import csv
+import io
 from pathlib import Path
 
-from ..db.database import get_db
+from ..db.database import get_db, get_read_db
 from ..models.product import Product
 from ..models.category import Category
 from ..api.auth import get_current_user
 from ..models.user import User
+from ..core.serialization import FastJSONResponse, PRODUCT_COLUMNS, PRODUCT_COMPACT_COLUMNS, serialize_products, check_response_format
+from ..core.performance import ResponseOptimizer
+from ..core.config import settings
+from ..utils.images import ALLOWED_IMAGE_TYPES, MULTIPART_OVERHEAD_BYTES, ImageTooLargeError, store_upload, create_variants, image_variant_urls
 
 # Pydantic models
 class ProductCreate(BaseModel):
@@ -37,6 +44,7 @@ class ProductResponse(BaseModel):
     price: float
     stock: int
     image_url: Optional[str] = None
+    image_variants: Dict[str, str] = {}  # e.g. {"thumb": url, "medium": url}
     category_id: int
     created_at: str
     updated_at: Optional[str] = None
@@ -44,6 +52,21 @@ class ProductResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class ProductBulkRow(BaseModel):
+    name: str
+    description: Optional[str] = None
+    price: Optional[float] = None
+    stock: Optional[int] = None
+    image_url: Optional[str] = None
+    category_id: Optional[int] = None
+    category: Optional[str] = None  # category name, resolved when category_id is missing
+
+class BulkProductResponse(BaseModel):
+    created_count: int
+    updated_count: int
+    failed_count: int
+    results: List[dict]  # [{"row": int, "name": str, "status": str, "product_id": int, "error": str}]
+
 router = APIRouter()
 
 def check_write_access(current_user: User):
@@ -55,30 +78,238 @@ def check_write_access(current_user: User):
         )
 
 # Create uploads directory if it doesn't exist
-UPLOAD_DIR = Path("uploads/products")
+UPLOAD_DIR = Path(settings.UPLOAD_DIR) / "products"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+# Maximum number of rows accepted by a single bulk import
+BULK_MAX_ROWS = 5000
+
+async def read_bulk_rows(request: Request) -> List[dict]:
+    """Read bulk import rows from a CSV body, a CSV file upload or a JSON body"""
+    content_type = request.headers.get("content-type", "")
+
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or not hasattr(upload, "read"):
+            raise HTTPException(status_code=400, detail="Multipart uploads must include a 'file' field")
+        raw = await upload.read()
+        return parse_csv_rows(raw)
+
+    if content_type.startswith("text/csv") or content_type.startswith("application/csv"):
+        return parse_csv_rows(await request.body())
+
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body must be CSV or JSON")
+
+    # Accept either a bare list of rows or {"rows": [...]}
+    if isinstance(payload, dict):
+        payload = payload.get("rows")
+    if not isinstance(payload, list):
+        raise HTTPException(status_code=400, detail="JSON body must be a list of rows or {\"rows\": [...]}")
+    return payload
+
+def parse_csv_rows(raw: bytes) -> List[dict]:
+    """Parse CSV bytes into row dicts, treating empty cells as missing values"""
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV file must be UTF-8 encoded")
+
+    reader = csv.DictReader(io.StringIO(text))
+    return [
+        {
+            key.strip().lower(): value.strip()
+            for key, value in row.items()
+            if key and value is not None and value.strip() != ""
+        }
+        for row in reader
+    ]
+
 @router.get("/", response_model=List[ProductResponse])
 async def get_products(
+    response_format: str = Query("full", alias="format"),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get all products. Pass format=compact for a columnar payload."""
+    check_response_format(response_format)
+    
+    if response_format == "compact":
+        products = db.query(Product).with_entities(*PRODUCT_COMPACT_COLUMNS).all()
+        return FastJSONResponse(ResponseOptimizer.compress_product_data(products))
+    
+    products = db.query(Product).with_entities(*PRODUCT_COLUMNS).all()
+    return FastJSONResponse(serialize_products(products))
+
+@router.post("/bulk", response_model=BulkProductResponse)
+async def bulk_upsert_products(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all products."""
-    products = db.query(Product).all()
-    return [
-        ProductResponse(
-            id=prod.id,
-            name=prod.name,
-            description=prod.description,
-            price=prod.price,
-            stock=prod.stock,
-            image_url=prod.image_url,
-            category_id=prod.category_id,
-            created_at=prod.created_at.isoformat() if prod.created_at else "",
-            updated_at=prod.updated_at.isoformat() if prod.updated_at else None
-        )
-        for prod in products
-    ]
+    """Create or update many products at once from CSV or JSON rows.
+
+    Rows are matched to existing products by name. Categories and names are
+    validated with set-based queries and all changes are written in one
+    transaction; the response reports the outcome of every row.
+    """
+    check_write_access(current_user)
+
+    raw_rows = await read_bulk_rows(request)
+    if not raw_rows:
+        raise HTTPException(status_code=400, detail="No rows provided")
+
+    if len(raw_rows) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"Cannot import more than {BULK_MAX_ROWS} rows at once")
+
+    results = []
+    rows = []  # (row_number, ProductBulkRow)
+    seen_names = set()
+
+    for row_number, raw_row in enumerate(raw_rows, start=1):
+        if not isinstance(raw_row, dict):
+            results.append({"row": row_number, "name": None, "status": "failed", "error": "Row must be an object"})
+            continue
+
+        try:
+            row = ProductBulkRow(**raw_row)
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors())
+            results.append({"row": row_number, "name": raw_row.get("name"), "status": "failed", "error": errors})
+            continue
+
+        row.name = row.name.strip()
+        if not row.name:
+            results.append({"row": row_number, "name": row.name, "status": "failed", "error": "Product name is required"})
+            continue
+
+        if row.name in seen_names:
+            results.append({"row": row_number, "name": row.name, "status": "failed", "error": "Duplicate product name in upload"})
+            continue
+
+        seen_names.add(row.name)
+        rows.append((row_number, row))
+
+    # Resolve categories and existing products with one query each
+    category_ids = {row.category_id for _, row in rows if row.category_id is not None}
+    category_names = {row.category for _, row in rows if row.category_id is None and row.category}
+
+    valid_category_ids = set()
+    if category_ids:
+        valid_category_ids = {
+            category_id for (category_id,) in db.query(Category.id).filter(Category.id.in_(category_ids)).all()
+        }
+
+    category_ids_by_name = {}
+    if category_names:
+        category_ids_by_name = {
+            name: category_id
+            for category_id, name in db.query(Category.id, Category.name).filter(Category.name.in_(category_names)).all()
+        }
+
+    existing_products = {}
+    if rows:
+        existing_products = {
+            name: product_id
+            for product_id, name in db.query(Product.id, Product.name).filter(
+                Product.name.in_([row.name for _, row in rows])
+            ).all()
+        }
+
+    inserts = []
+    updates = []
+    pending_results = []  # (row_number, name, status, product_id)
+
+    for row_number, row in rows:
+        category_id = row.category_id
+        if category_id is None and row.category:
+            category_id = category_ids_by_name.get(row.category)
+            if category_id is None:
+                results.append({"row": row_number, "name": row.name, "status": "failed", "error": f"Category '{row.category}' not found"})
+                continue
+        elif category_id is not None and category_id not in valid_category_ids:
+            results.append({"row": row_number, "name": row.name, "status": "failed", "error": "Category not found"})
+            continue
+
+        product_id = existing_products.get(row.name)
+
+        if product_id is None:
+            missing = [field for field, value in (("price", row.price), ("category_id", category_id)) if value is None]
+            if missing:
+                results.append({"row": row_number, "name": row.name, "status": "failed", "error": f"Missing required fields for new product: {', '.join(missing)}"})
+                continue
+
+            inserts.append({
+                "name": row.name,
+                "description": row.description or "",
+                "price": row.price,
+                "stock": row.stock if row.stock is not None else 0,
+                "image_url": row.image_url,
+                "category_id": category_id
+            })
+            pending_results.append((row_number, row.name, "created", None))
+        else:
+            # Only overwrite the fields that were provided for this row
+            values = {"id": product_id}
+            if row.description is not None:
+                values["description"] = row.description
+            if row.price is not None:
+                values["price"] = row.price
+            if row.stock is not None:
+                values["stock"] = row.stock
+            if row.image_url is not None:
+                values["image_url"] = row.image_url
+            if category_id is not None:
+                values["category_id"] = category_id
+
+            if len(values) > 1:
+                updates.append(values)
+            pending_results.append((row_number, row.name, "updated", product_id))
+
+    try:
+        if inserts:
+            db.execute(insert(Product), inserts)
+        # Group updates by column set so each group is a single executemany
+        updates_by_columns = {}
+        for values in updates:
+            updates_by_columns.setdefault(tuple(sorted(values)), []).append(values)
+        for grouped_updates in updates_by_columns.values():
+            db.execute(update(Product), grouped_updates)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error importing products: {str(e)}")
+
+    if inserts:
+        created_ids = {
+            name: product_id
+            for product_id, name in db.query(Product.id, Product.name).filter(
+                Product.name.in_([values["name"] for values in inserts])
+            ).all()
+        }
+    else:
+        created_ids = {}
+
+    for row_number, name, row_status, product_id in pending_results:
+        results.append({
+            "row": row_number,
+            "name": name,
+            "status": row_status,
+            "product_id": product_id if product_id is not None else created_ids.get(name)
+        })
+
+    results.sort(key=lambda result: result["row"])
+    print(f"📦 Bulk product import: {len(inserts)} created, {len(pending_results) - len(inserts)} updated, {len(results) - len(pending_results)} failed")
+
+    return BulkProductResponse(
+        created_count=len(inserts),
+        updated_count=len(pending_results) - len(inserts),
+        failed_count=len(results) - len(pending_results),
+        results=results
+    )
 
 @router.get("/{product_id}", response_model=ProductResponse)
 async def get_product(
@@ -98,6 +329,7 @@ async def get_product(
         price=product.price,
         stock=product.stock,
         image_url=product.image_url,
+        image_variants=image_variant_urls(product.image_url),
         category_id=product.category_id,
         created_at=product.created_at.isoformat() if product.created_at else "",
         updated_at=product.updated_at.isoformat() if product.updated_at else None
@@ -143,6 +375,7 @@ async def create_product(
         price=db_product.price,
         stock=db_product.stock,
         image_url=db_product.image_url,
+        image_variants=image_variant_urls(db_product.image_url),
         category_id=db_product.category_id,
         created_at=db_product.created_at.isoformat() if db_product.created_at else "",
         updated_at=db_product.updated_at.isoformat() if db_product.updated_at else None
@@ -192,6 +425,7 @@ async def update_product(
         price=product.price,
         stock=product.stock,
         image_url=product.image_url,
+        image_variants=image_variant_urls(product.image_url),
         category_id=product.category_id,
         created_at=product.created_at.isoformat() if product.created_at else "",
         updated_at=product.updated_at.isoformat() if product.updated_at else None
@@ -215,32 +449,77 @@ async def delete_product(
     
     return {"message": "Product deleted successfully"}
 
-@router.post("/{product_id}/upload-image", response_model=ProductResponse)
+IMAGE_UPLOAD_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "required": ["file"],
+                "properties": {"file": {"type": "string", "format": "binary"}}
+            }
+        }
+    }
+}
+
+@router.post("/{product_id}/upload-image", response_model=ProductResponse, openapi_extra={"requestBody": IMAGE_UPLOAD_BODY})
 async def upload_product_image(
     product_id: int,
-    file: UploadFile = File(...),
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Upload an image for a product."""
+    """Upload an image for a product (multipart form field `file`)."""
     check_write_access(current_user)
     
+    # Starlette spools the whole multipart body to disk while parsing it, so
+    # oversized requests are refused from their Content-Length before any is read
+    max_bytes = settings.MAX_IMAGE_UPLOAD_MB * 1024 * 1024
+    content_length = request.headers.get("content-length", "")
+    if not content_length.isdigit():
+        raise HTTPException(status_code=status.HTTP_411_LENGTH_REQUIRED, detail="Content-Length header is required")
+    if int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image exceeds the {settings.MAX_IMAGE_UPLOAD_MB} MB limit"
+        )
+    
     product = db.query(Product).filter(Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    form = await request.form(max_files=1)
+    file = form.get("file")
+    if not isinstance(file, UploadFile):
+        await form.close()
+        raise HTTPException(status_code=400, detail="An image file is required in the 'file' form field")
+    
     # Validate file type
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
+    extension = ALLOWED_IMAGE_TYPES.get(file.content_type)
+    if extension is None:
+        await form.close()
+        raise HTTPException(
+            status_code=400,
+            detail=f"File must be an image of type: {', '.join(ALLOWED_IMAGE_TYPES)}"
+        )
     
-    # Generate unique filename
-    file_extension = file.filename.split(".")[-1]
-    new_filename = f"product_{product_id}_{int(time.time())}.{file_extension}"
-    file_path = UPLOAD_DIR / new_filename
+    # Copy to disk in chunks off the event loop; files are named by content hash,
+    # so re-uploading the same image reuses the stored file
+    try:
+        new_filename = await run_in_threadpool(store_upload, file.file, UPLOAD_DIR, extension, max_bytes)
+    except ImageTooLargeError:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image exceeds the {settings.MAX_IMAGE_UPLOAD_MB} MB limit"
+        )
+    finally:
+        await form.close()
     
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Thumbnails are best effort; the original is kept even if resizing fails
+    try:
+        await create_variants(UPLOAD_DIR / new_filename)
+    except Exception as e:
+        print(f"⚠️ Could not generate image variants for {new_filename}: {str(e)}")
     
     # Update product with image URL
     product.image_url = f"/uploads/products/{new_filename}"
@@ -254,6 +533,7 @@ async def upload_product_image(
         price=product.price,
         stock=product.stock,
         image_url=product.image_url,
+        image_variants=image_variant_urls(product.image_url),
         category_id=product.category_id,
         created_at=product.created_at.isoformat() if product.created_at else "",
         updated_at=product.updated_at.isoformat() if product.updated_at else None
@@ -1,16 +1,29 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func, text
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-from datetime import datetime, date
+from sqlalchemy import func
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from typing import List, Optional, Dict, Any, Callable, Tuple, Type
+from datetime import datetime, date, timedelta
+import asyncio
+import time
 
-from ..db.database import get_db
-from ..models.sales import Sale
+from ..db.database import get_db, get_read_db, open_read_session, client_key
 from ..models.product import Product
 from ..models.customer import Customer
 from ..models.user import User
-from ..api.auth import get_current_user, get_admin_or_manager_user
+from ..models.report_job import ReportJob
+from ..api.auth import get_current_user, get_admin_user, get_admin_or_manager_user
+from ..services.rollups import (
+    PRODUCT_SORT_OPTIONS, get_top_products, get_product_series, rebuild_product_sales_rollup,
+    get_sales_heatmap, rebuild_hourly_sales_rollup
+)
+from ..services.archive import sale_tables, sales_union
+from ..utils.timezones import business_today
+from ..services.comparison import PERIOD_OPTIONS, resolve_periods, compare_periods
+from ..services.report_jobs import JobContext, report_jobs, serialize_job
+from ..core.config import settings
+from ..core.performance import chunked
 
 # Pydantic models
 class DateRangeRequest(BaseModel):
@@ -36,244 +49,584 @@ class PaymentMethodResponse(BaseModel):
     total_amount: float
     percentage_of_total: float
 
+class ReportJobRequest(BaseModel):
+    report: str
+    params: Dict[str, Any] = {}
+
+class ReportJobParams(BaseModel):
+    from_date: Optional[date] = Field(None, alias="from")
+    to_date: Optional[date] = Field(None, alias="to")
+
+    class Config:
+        populate_by_name = True
+        extra = "forbid"
+
+    # Checked when the job is submitted, so bad parameters are a 400 rather than a failed job
+    @model_validator(mode="after")
+    def check_date_order(self):
+        if self.from_date and self.to_date and self.from_date > self.to_date:
+            raise ValueError("from must not be after to")
+        return self
+
+class TopProductsJobParams(ReportJobParams):
+    limit: int = Field(10, ge=1, le=100)
+    order_by: str = Field("revenue", pattern="^(revenue|quantity)$")
+
+class CompareJobParams(ReportJobParams):
+    period: str = Field("week", pattern="^(day|week|month|custom)$")
+
+    @model_validator(mode="after")
+    def check_custom_range(self):
+        if self.period == "custom" and not (self.from_date and self.to_date):
+            raise ValueError("from and to are required for a custom period")
+        return self
+
 router = APIRouter()
 
+def _resolve_date_strings(from_date: Optional[str], to_date: Optional[str]) -> Tuple[str, str]:
+    """Fill in the last 30 days unless both dates are given"""
+    if not from_date or not to_date:
+        today = datetime.now().date()
+        return (today - timedelta(days=30)).isoformat(), today.isoformat()
+    return from_date, to_date
+
+def build_sales_by_date(db: Session, from_date: str, to_date: str) -> Dict[str, Any]:
+    """Sales grouped by date over the settled sales in range."""
+    # Query sales grouped by date (archived sales too when the range reaches them)
+    rows_in_range = sales_union(
+        sale_tables(db, from_date),
+        ("timestamp", "total_price"),
+        lambda table: (func.date(table.timestamp).between(from_date, to_date), table.is_settled == True)
+    )
+    sale_date = func.date(rows_in_range.c.timestamp)
+    rows = db.query(
+        sale_date,
+        func.count(),
+        func.sum(rows_in_range.c.total_price),
+        func.avg(rows_in_range.c.total_price)
+    ).group_by(sale_date).order_by(sale_date.desc()).all()
+
+    sales_by_date = [
+        {
+            "date": row[0],
+            "transaction_count": row[1],
+            "total_sales": float(row[2]) if row[2] else 0.0,
+            "average_order_value": float(row[3]) if row[3] else 0.0
+        }
+        for row in rows
+    ]
+
+    return {
+        "date_range": f"{from_date} to {to_date}",
+        "total_days": len(sales_by_date),
+        "sales_by_date": sales_by_date,
+        "summary": {
+            "total_sales": sum(day["total_sales"] for day in sales_by_date),
+            "total_transactions": sum(day["transaction_count"] for day in sales_by_date),
+            "average_daily_sales": sum(day["total_sales"] for day in sales_by_date) / len(sales_by_date) if sales_by_date else 0
+        }
+    }
+
 @router.get("/sales-by-date")
 async def get_sales_by_date(
     from_date: Optional[str] = None,
     to_date: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_admin_or_manager_user)
 ):
     """Get sales grouped by date."""
     try:
-        # Default to last 30 days if no dates provided
-        if not from_date or not to_date:
-            from datetime import timedelta
-            today = datetime.now().date()
-            from_date = (today - timedelta(days=30)).isoformat()
-            to_date = today.isoformat()
-        
-        # Query sales grouped by date
-        query = text("""
-            SELECT 
-                DATE(timestamp) as sale_date,
-                COUNT(*) as transaction_count,
-                SUM(total_price) as total_sales,
-                AVG(total_price) as average_order_value
-            FROM sales 
-            WHERE DATE(timestamp) BETWEEN :from_date AND :to_date
-            AND is_settled = TRUE
-            GROUP BY DATE(timestamp)
-            ORDER BY DATE(timestamp) DESC
-        """)
-        
-        result = db.execute(query, {"from_date": from_date, "to_date": to_date})
-        rows = result.fetchall()
-        
-        sales_by_date = [
-            {
-                "date": row[0],
-                "transaction_count": row[1],
-                "total_sales": float(row[2]) if row[2] else 0.0,
-                "average_order_value": float(row[3]) if row[3] else 0.0
-            }
-            for row in rows
-        ]
-        
-        return {
-            "date_range": f"{from_date} to {to_date}",
-            "total_days": len(sales_by_date),
-            "sales_by_date": sales_by_date,
-            "summary": {
-                "total_sales": sum(day["total_sales"] for day in sales_by_date),
-                "total_transactions": sum(day["transaction_count"] for day in sales_by_date),
-                "average_daily_sales": sum(day["total_sales"] for day in sales_by_date) / len(sales_by_date) if sales_by_date else 0
-            }
-        }
+        from_date, to_date = _resolve_date_strings(from_date, to_date)
+        return build_sales_by_date(db, from_date, to_date)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating sales by date report: {str(e)}")
 
+SALES_BY_PRODUCT_BATCH = 500
+
+def build_sales_by_product(db: Session, from_date: str, to_date: str, job: Optional[JobContext] = None) -> Dict[str, Any]:
+    """
+    Product totals over the settled sales in range, expanded from Sale.items.
+    The matching ids are read first (from the archive too when the range reaches
+    it), then the items in primary-key batches, and products are looked up once;
+    a report job gets progress updates (and stops when cancelled) after every batch. No cursor stays open between batches, so
+    the progress writes never wait on this report's reads (SQLite allows no
+    commit while a read is open).
+    """
+    sale_ids = {
+        table: [sale_id for (sale_id,) in db.query(table.id).filter(
+            func.date(table.timestamp) >= from_date,
+            func.date(table.timestamp) <= to_date,
+            table.is_settled == True
+        ).order_by(table.id).all()]
+        for table in sale_tables(db, from_date)
+    }
+    total_sales = sum(len(ids) for ids in sale_ids.values())
+    products_by_id = {product.id: product for product in db.query(Product.id, Product.name, Product.price).all()}
+    
+    # Process product sales from JSON items
+    product_sales = {}
+    total_revenue = 0
+    processed = 0
+    
+    batches = ((table, batch_ids) for table, ids in sale_ids.items() for batch_ids in chunked(ids, SALES_BY_PRODUCT_BATCH))
+    for table, batch_ids in batches:
+        batch = db.query(table.items).filter(table.id.in_(batch_ids)).all()
+        processed += len(batch_ids)
+        if job:
+            job.progress(processed / total_sales)
+        
+        for item in (item for (items,) in batch for item in items or []):
+            product_id = item.get('product_id')
+            quantity = item.get('quantity', 0)
+            
+            # Get product info
+            product = products_by_id.get(product_id)
+            product_name = product.name if product else f"Product {product_id}"
+            product_price = product.price if product else 0
+            
+            item_total = quantity * product_price
+            total_revenue += item_total
+            
+            if product_id not in product_sales:
+                product_sales[product_id] = {
+                    "product_id": product_id,
+                    "product_name": product_name,
+                    "quantity_sold": 0,
+                    "total_revenue": 0.0
+                }
+            
+            product_sales[product_id]["quantity_sold"] += quantity
+            product_sales[product_id]["total_revenue"] += item_total
+    
+    # Calculate percentages and sort by revenue
+    product_list = []
+    for product_data in product_sales.values():
+        percentage = (product_data["total_revenue"] / total_revenue * 100) if total_revenue > 0 else 0
+        product_data["percentage_of_total"] = round(percentage, 2)
+        product_list.append(product_data)
+    
+    product_list.sort(key=lambda x: x["total_revenue"], reverse=True)
+    
+    return {
+        "date_range": f"{from_date} to {to_date}",
+        "total_products": len(product_list),
+        "products": product_list,
+        "summary": {
+            "total_revenue": total_revenue,
+            "total_quantity_sold": sum(p["quantity_sold"] for p in product_list)
+        }
+    }
+
 @router.get("/sales-by-product")
 async def get_sales_by_product(
     from_date: Optional[str] = None,
     to_date: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_admin_or_manager_user)
 ):
     """Get sales grouped by product."""
     try:
-        # Default to last 30 days if no dates provided
-        if not from_date or not to_date:
-            from datetime import timedelta
-            today = datetime.now().date()
-            from_date = (today - timedelta(days=30)).isoformat()
-            to_date = today.isoformat()
-        
-        # Get all sales in date range
-        sales = db.query(Sale).filter(
-            func.date(Sale.timestamp) >= from_date,
-            func.date(Sale.timestamp) <= to_date,
-            Sale.is_settled == True
-        ).all()
-        
-        # Process product sales from JSON items
-        product_sales = {}
-        total_revenue = 0
-        
-        for sale in sales:
-            if sale.items:
-                for item in sale.items:
-                    product_id = item.get('product_id')
-                    quantity = item.get('quantity', 0)
-                    
-                    # Get product info
-                    product = db.query(Product).filter(Product.id == product_id).first()
-                    product_name = product.name if product else f"Product {product_id}"
-                    product_price = product.price if product else 0
-                    
-                    item_total = quantity * product_price
-                    total_revenue += item_total
-                    
-                    if product_id not in product_sales:
-                        product_sales[product_id] = {
-                            "product_id": product_id,
-                            "product_name": product_name,
-                            "quantity_sold": 0,
-                            "total_revenue": 0.0
-                        }
-                    
-                    product_sales[product_id]["quantity_sold"] += quantity
-                    product_sales[product_id]["total_revenue"] += item_total
-        
-        # Calculate percentages and sort by revenue
-        product_list = []
-        for product_data in product_sales.values():
-            percentage = (product_data["total_revenue"] / total_revenue * 100) if total_revenue > 0 else 0
-            product_data["percentage_of_total"] = round(percentage, 2)
-            product_list.append(product_data)
-        
-        product_list.sort(key=lambda x: x["total_revenue"], reverse=True)
-        
-        return {
-            "date_range": f"{from_date} to {to_date}",
-            "total_products": len(product_list),
-            "products": product_list,
-            "summary": {
-                "total_revenue": total_revenue,
-                "total_quantity_sold": sum(p["quantity_sold"] for p in product_list)
-            }
-        }
+        from_date, to_date = _resolve_date_strings(from_date, to_date)
+        return build_sales_by_product(db, from_date, to_date)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating sales by product report: {str(e)}")
 
+def default_date_range(from_date: Optional[date], to_date: Optional[date]):
+    """Fill in missing bounds with the last 30 business days"""
+    today = business_today()
+    return from_date or today - timedelta(days=30), to_date or today
+
+def build_top_products(db: Session, from_date: date, to_date: date, limit: int, order_by: str) -> Dict[str, Any]:
+    """Best-selling products in range from the daily product rollup."""
+    return {
+        "date_range": f"{from_date} to {to_date}",
+        "order_by": order_by,
+        "products": get_top_products(db, from_date, to_date, limit, order_by)
+    }
+
+@router.get("/products/top")
+async def get_top_products_report(
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    limit: int = Query(10, ge=1, le=100),
+    order_by: str = "revenue",
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_admin_or_manager_user)
+):
+    """Get the best-selling products by revenue or quantity from the daily product rollup."""
+    if order_by not in PRODUCT_SORT_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"order_by must be one of: {', '.join(PRODUCT_SORT_OPTIONS)}")
+    from_date, to_date = default_date_range(from_date, to_date)
+    return build_top_products(db, from_date, to_date, limit, order_by)
+
+@router.get("/products/{product_id}/series")
+async def get_product_sales_series(
+    product_id: int,
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    granularity: str = "day",
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_admin_or_manager_user)
+):
+    """Get a product's units sold and revenue per day, week or month from the daily product rollup."""
+    if granularity not in ("day", "week", "month"):
+        raise HTTPException(status_code=400, detail="Granularity must be one of: day, week, month")
+    from_date, to_date = default_date_range(from_date, to_date)
+    
+    product = db.query(Product.name).filter(Product.id == product_id).first()
+    periods = get_product_series(db, product_id, from_date, to_date, granularity)
+    
+    return {
+        "product_id": product_id,
+        "product_name": product.name if product else f"Product {product_id}",
+        "date_range": f"{from_date} to {to_date}",
+        "granularity": granularity,
+        "periods": periods,
+        "summary": {
+            "quantity_sold": sum(period["quantity_sold"] for period in periods),
+            "total_revenue": sum(period["total_revenue"] for period in periods)
+        }
+    }
+
+@router.post("/products/rebuild")
+async def rebuild_product_sales(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """Rebuild the daily product rollup from the settled sales (admin only)."""
+    try:
+        rows = rebuild_product_sales_rollup(db)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error rebuilding product sales rollup: {str(e)}")
+    
+    return {"message": "Product sales rollup rebuilt successfully", "rows": rows}
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+def build_sales_heatmap(db: Session, from_date: date, to_date: date) -> Dict[str, Any]:
+    """Settled transactions and revenue per weekday and hour from the hourly rollup."""
+    heatmap = get_sales_heatmap(db, from_date, to_date)
+    transactions = heatmap["transactions"]
+    
+    busiest = max(
+        ((weekday, hour) for weekday in range(7) for hour in range(24)),
+        key=lambda cell: transactions[cell[0]][cell[1]]
+    )
+    
+    return {
+        "date_range": f"{from_date} to {to_date}",
+        "timezone": settings.BUSINESS_TIMEZONE,
+        "weekdays": WEEKDAYS,
+        "hours": list(range(24)),
+        "transactions": transactions,
+        "revenue": heatmap["revenue"],
+        "summary": {
+            "total_transactions": sum(map(sum, transactions)),
+            "total_revenue": round(sum(map(sum, heatmap["revenue"])), 2),
+            "busiest": {
+                "weekday": WEEKDAYS[busiest[0]],
+                "hour": busiest[1],
+                "transactions": transactions[busiest[0]][busiest[1]]
+            } if transactions[busiest[0]][busiest[1]] else None
+        }
+    }
+
+@router.get("/heatmap")
+async def get_sales_heatmap_report(
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_admin_or_manager_user)
+):
+    """Get settled transactions and revenue by weekday and hour of day in the business timezone."""
+    from_date, to_date = default_date_range(from_date, to_date)
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    
+    return build_sales_heatmap(db, from_date, to_date)
+
+@router.post("/heatmap/rebuild")
+async def rebuild_sales_heatmap(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """Rebuild the hourly sales rollup behind the heatmap from the settled sales (admin only)."""
+    try:
+        hours = rebuild_hourly_sales_rollup(db)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error rebuilding hourly sales rollup: {str(e)}")
+    
+    return {"message": "Hourly sales rollup rebuilt successfully", "hours": hours}
+
+@router.get("/compare")
+async def get_period_comparison(
+    period: str = "week",
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_admin_or_manager_user)
+):
+    """
+    Compare revenue, transactions, average order value and payment mix of the
+    current period with the previous one and the same period last year.
+    period=day|week|month compares today / this week / this month so far; pass
+    from and to for a custom range.
+    """
+    if period not in PERIOD_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"Period must be one of: {', '.join(PERIOD_OPTIONS)}")
+    try:
+        periods = resolve_periods(period, from_date, to_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        return compare_periods(db, periods)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating comparison report: {str(e)}")
+
+def build_payment_breakdown(db: Session, from_date: str, to_date: str) -> Dict[str, Any]:
+    """Settled sales per payment method in range."""
+    # Query payment method breakdown (archived sales too when the range reaches them)
+    rows_in_range = sales_union(
+        sale_tables(db, from_date),
+        ("payment_method", "total_price"),
+        lambda table: (func.date(table.timestamp).between(from_date, to_date), table.is_settled == True)
+    )
+    total_amount_column = func.sum(rows_in_range.c.total_price)
+    rows = db.query(
+        rows_in_range.c.payment_method,
+        func.count(),
+        total_amount_column
+    ).group_by(rows_in_range.c.payment_method).order_by(total_amount_column.desc()).all()
+
+    total_amount = sum(float(row[2]) for row in rows if row[2])
+
+    payment_methods = [
+        {
+            "payment_method": row[0],
+            "transaction_count": row[1],
+            "total_amount": float(row[2]) if row[2] else 0.0,
+            "percentage_of_total": round((float(row[2]) / total_amount * 100) if total_amount > 0 else 0, 2)
+        }
+        for row in rows
+    ]
+
+    return {
+        "date_range": f"{from_date} to {to_date}",
+        "payment_methods": payment_methods,
+        "summary": {
+            "total_amount": total_amount,
+            "total_transactions": sum(pm["transaction_count"] for pm in payment_methods)
+        }
+    }
+
 @router.get("/payment-breakdown")
 async def get_payment_breakdown(
     from_date: Optional[str] = None,
     to_date: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_admin_or_manager_user)
 ):
     """Get payment method breakdown."""
     try:
-        # Default to last 30 days if no dates provided
-        if not from_date or not to_date:
-            from datetime import timedelta
-            today = datetime.now().date()
-            from_date = (today - timedelta(days=30)).isoformat()
-            to_date = today.isoformat()
-        
-        # Query payment method breakdown
-        query = text("""
-            SELECT 
-                payment_method,
-                COUNT(*) as transaction_count,
-                SUM(total_price) as total_amount
-            FROM sales 
-            WHERE DATE(timestamp) BETWEEN :from_date AND :to_date
-            AND is_settled = TRUE
-            GROUP BY payment_method
-            ORDER BY total_amount DESC
-        """)
-        
-        result = db.execute(query, {"from_date": from_date, "to_date": to_date})
-        rows = result.fetchall()
-        
-        total_amount = sum(float(row[2]) for row in rows if row[2])
-        
-        payment_methods = [
-            {
-                "payment_method": row[0],
-                "transaction_count": row[1],
-                "total_amount": float(row[2]) if row[2] else 0.0,
-                "percentage_of_total": round((float(row[2]) / total_amount * 100) if total_amount > 0 else 0, 2)
-            }
-            for row in rows
-        ]
-        
-        return {
-            "date_range": f"{from_date} to {to_date}",
-            "payment_methods": payment_methods,
-            "summary": {
-                "total_amount": total_amount,
-                "total_transactions": sum(pm["transaction_count"] for pm in payment_methods)
-            }
-        }
+        from_date, to_date = _resolve_date_strings(from_date, to_date)
+        return build_payment_breakdown(db, from_date, to_date)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating payment breakdown report: {str(e)}")
 
+def build_sales_summary(db: Session, from_date: str, to_date: str) -> Dict[str, Any]:
+    """Settled and pending sales counts and totals in range."""
+    # Get basic sales metrics (count and sum per settlement state, in the database)
+    rows_in_range = sales_union(
+        sale_tables(db, from_date),
+        ("is_settled", "total_price"),
+        lambda table: (func.date(table.timestamp) >= from_date, func.date(table.timestamp) <= to_date)
+    )
+    totals = {
+        bool(is_settled): (count, float(amount or 0))
+        for is_settled, count, amount in db.query(
+            rows_in_range.c.is_settled, func.count(), func.sum(rows_in_range.c.total_price)
+        ).group_by(rows_in_range.c.is_settled).all()
+    }
+    settled_count, total_revenue = totals.get(True, (0, 0))
+    pending_count, pending_amount = totals.get(False, (0, 0))
+
+    return {
+        "date_range": f"{from_date} to {to_date}",
+        "settled_sales": {
+            "count": settled_count,
+            "total_amount": total_revenue,
+            "average_order_value": total_revenue / settled_count if settled_count else 0
+        },
+        "pending_sales": {
+            "count": pending_count,
+            "total_amount": pending_amount
+        },
+        "overall": {
+            "total_transactions": settled_count + pending_count,
+            "total_gross_sales": total_revenue + pending_amount,
+            "settlement_rate": (settled_count / (settled_count + pending_count) * 100) if (settled_count or pending_count) else 0
+        }
+    }
+
 @router.get("/sales-summary")
 async def get_sales_summary(
     from_date: Optional[str] = None,
     to_date: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_admin_or_manager_user)
 ):
     """Get comprehensive sales summary."""
     try:
-        # Default to last 30 days if no dates provided
-        if not from_date or not to_date:
-            from datetime import timedelta
-            today = datetime.now().date()
-            from_date = (today - timedelta(days=30)).isoformat()
-            to_date = today.isoformat()
-        
-        # Get basic sales metrics
-        settled_sales = db.query(Sale).filter(
-            func.date(Sale.timestamp) >= from_date,
-            func.date(Sale.timestamp) <= to_date,
-            Sale.is_settled == True
-        ).all()
-        
-        pending_sales = db.query(Sale).filter(
-            func.date(Sale.timestamp) >= from_date,
-            func.date(Sale.timestamp) <= to_date,
-            Sale.is_settled == False
-        ).all()
-        
-        total_revenue = sum(sale.total_price for sale in settled_sales)
-        pending_amount = sum(sale.total_price for sale in pending_sales)
-        
-        return {
-            "date_range": f"{from_date} to {to_date}",
-            "settled_sales": {
-                "count": len(settled_sales),
-                "total_amount": total_revenue,
-                "average_order_value": total_revenue / len(settled_sales) if settled_sales else 0
-            },
-            "pending_sales": {
-                "count": len(pending_sales),
-                "total_amount": pending_amount
-            },
-            "overall": {
-                "total_transactions": len(settled_sales) + len(pending_sales),
-                "total_gross_sales": total_revenue + pending_amount,
-                "settlement_rate": (len(settled_sales) / (len(settled_sales) + len(pending_sales)) * 100) if (settled_sales or pending_sales) else 0
-            }
-        }
+        from_date, to_date = _resolve_date_strings(from_date, to_date)
+        return build_sales_summary(db, from_date, to_date)
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating sales summary: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error generating sales summary: {str(e)}")
+
+# Report jobs: every report that can run in the background, as
+# name -> (parameter model, runner(db, params, job) returning the report body)
+def _date_str(value: Optional[date]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+def _job_date_strings(params: ReportJobParams) -> Tuple[str, str]:
+    return _resolve_date_strings(_date_str(params.from_date), _date_str(params.to_date))
+
+def _sales_by_product_job(db: Session, params: ReportJobParams, job: JobContext):
+    return build_sales_by_product(db, *_job_date_strings(params), job)
+
+def _compare_job(db: Session, params: CompareJobParams, job: JobContext):
+    return compare_periods(db, resolve_periods(params.period, params.from_date, params.to_date))
+
+# Reports combined by /overview, keyed by their name in the response
+OVERVIEW_REPORTS = {
+    "sales_by_date": build_sales_by_date,
+    "sales_by_product": build_sales_by_product,
+    "payment_breakdown": build_payment_breakdown,
+    "sales_summary": build_sales_summary,
+}
+
+def _run_report_in_session(build, read_key: Optional[str], from_date: str, to_date: str):
+    """Build one report on its own pooled read connection (called from a worker thread)"""
+    db = open_read_session(read_key)
+    try:
+        return build(db, from_date, to_date)
+    finally:
+        db.close()
+
+@router.get("/overview")
+async def get_reports_overview(
+    request: Request,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    current_user: User = Depends(get_admin_or_manager_user)
+):
+    """
+    Sales by date, sales by product, payment breakdown and sales summary for one
+    range in a single response. The four reports run concurrently, each in a
+    worker thread with its own database connection, so the response takes about
+    as long as the slowest of them.
+    """
+    from_date, to_date = _resolve_date_strings(from_date, to_date)
+    start_time = time.time()
+    
+    try:
+        results = await asyncio.gather(*(
+            run_in_threadpool(_run_report_in_session, build, client_key(request), from_date, to_date)
+            for build in OVERVIEW_REPORTS.values()
+        ))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating reports overview: {str(e)}")
+    
+    print(f"📊 Reports overview for {from_date} to {to_date} built in {time.time() - start_time:.3f}s")
+    return {
+        "date_range": f"{from_date} to {to_date}",
+        **dict(zip(OVERVIEW_REPORTS, results))
+    }
+
+REPORT_JOBS: Dict[str, Tuple[Type[ReportJobParams], Callable]] = {
+    "sales-by-date": (ReportJobParams, lambda db, params, job: build_sales_by_date(db, *_job_date_strings(params))),
+    "sales-by-product": (ReportJobParams, _sales_by_product_job),
+    "payment-breakdown": (ReportJobParams, lambda db, params, job: build_payment_breakdown(db, *_job_date_strings(params))),
+    "sales-summary": (ReportJobParams, lambda db, params, job: build_sales_summary(db, *_job_date_strings(params))),
+    "products-top": (TopProductsJobParams, lambda db, params, job: build_top_products(
+        db, *default_date_range(params.from_date, params.to_date), params.limit, params.order_by)),
+    "heatmap": (ReportJobParams, lambda db, params, job: build_sales_heatmap(
+        db, *default_date_range(params.from_date, params.to_date))),
+    "compare": (CompareJobParams, _compare_job),
+    "overview": (ReportJobParams, lambda db, params, job: {
+        name: build(db, *_job_date_strings(params)) for name, build in OVERVIEW_REPORTS.items()
+    }),
+}
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_report_job(
+    job_request: ReportJobRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_or_manager_user)
+):
+    """
+    Run a report in the background. Poll GET /reports/jobs/{id} for progress and
+    the result, which is kept for REPORT_JOB_RETENTION_HOURS after it finishes.
+    """
+    if job_request.report not in REPORT_JOBS:
+        raise HTTPException(status_code=400, detail=f"Report must be one of: {', '.join(REPORT_JOBS)}")
+    
+    params_model, runner = REPORT_JOBS[job_request.report]
+    try:
+        params = params_model.model_validate(job_request.params)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid report parameters: {e.errors(include_url=False, include_context=False)}")
+    
+    job = report_jobs.submit(db, job_request.report, params, runner, current_user.id)
+    return serialize_job(job)
+
+@router.get("/jobs")
+async def list_report_jobs(
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_or_manager_user)
+):
+    """List the current user's recent report jobs, without their results."""
+    jobs = db.query(ReportJob).filter(
+        ReportJob.created_by == current_user.id
+    ).order_by(ReportJob.created_at.desc()).limit(limit).all()
+    
+    return [serialize_job(job, include_result=False) for job in jobs]
+
+def _get_visible_job(db: Session, job_id: str, current_user: User) -> ReportJob:
+    """The job if it exists and belongs to the user (admins see every job), else 404"""
+    job = report_jobs.get(db, job_id)
+    if not job or (job.created_by != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job
+
+@router.get("/jobs/{job_id}")
+async def get_report_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_or_manager_user)
+):
+    """Get a report job's status and progress, and its result once it has succeeded."""
+    return serialize_job(_get_visible_job(db, job_id, current_user))
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_report_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_or_manager_user)
+):
+    """Cancel a queued or running report job."""
+    job = _get_visible_job(db, job_id, current_user)
+    if not report_jobs.cancel(job_id):
+        raise HTTPException(status_code=400, detail=f"Report job is already {job.status}")
+    
+    db.refresh(job)
+    return serialize_job(job)
@@ -1,17 +1,37 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks, Query, Header
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime, date, timedelta
 import json
 import time
 
-from ..db.database import get_db
-from ..models.sales import Sale, RechargeTransaction
+from ..db.database import get_db, get_read_db
+from ..models.sales import Sale, ArchivedSale, RechargeTransaction
 from ..models.customer import Customer
 from ..models.product import Product
-from ..api.auth import get_current_user, get_any_role_user, get_admin_or_manager_user
+from ..api.auth import get_current_user, get_any_role_user, get_admin_or_manager_user, get_admin_user
 from ..models.user import User
 from ..utils.sms import sms_service
+from ..core.performance import chunked, KeysetPaginator, ResponseOptimizer
+from ..core.serialization import (
+    FastJSONResponse, SALE_COLUMNS, SALE_COMPACT_COLUMNS, RECHARGE_COLUMNS, RECHARGE_COMPACT_COLUMNS,
+    serialize_sales, serialize_recharges, check_response_format
+)
+from ..services.balance import debit_balance, credit_balance, debit_sales_batch, InsufficientBalanceError
+from ..services.rollups import (
+    record_recharge, rebuild_recharge_rollup, summarize_recharges,
+    record_pending_change, get_pending_totals, rebuild_pending_totals,
+    record_customer_purchases, record_product_sales, record_hourly_sales
+)
+from ..services.idempotency import validate_key, request_fingerprint, get_stored_response, save_response
+from ..services.events import broadcaster
+from ..services.worklist import GROUP_BY_OPTIONS, group_column, parse_group_key, list_pending_groups
+from ..services.today import today_counters
+from ..utils.timezones import business_today
 
 # Pydantic models
 class SaleItemCreate(BaseModel):
@@ -72,6 +92,9 @@ class RechargeResponse(BaseModel):
 
 router = APIRouter()
 
+# Maximum number of sales accepted by a single batch settlement
+BATCH_SETTLE_MAX_SALES = 5000
+
 def format_items_for_sms(sale_items, products):
     """Format sale items for SMS notification"""
     items_text = []
@@ -81,64 +104,192 @@ def format_items_for_sms(sale_items, products):
         items_text.append(f"{product_name} x{item['quantity']}")
     return ", ".join(items_text)
 
+def claim_pending_sales(db: Session, sale_ids: List[int], payment_method: str) -> set:
+    """
+    Mark the given sales settled with a conditional UPDATE that only matches
+    rows still pending, and return the ids it changed. A sale settled by a
+    concurrent request since it was read is left out, so it is never charged
+    or counted twice. Does not commit.
+    """
+    claimed = set()
+    for chunk in chunked(sale_ids):
+        statement = update(Sale).where(Sale.id.in_(chunk), Sale.is_settled == False).values(
+            is_settled=True, payment_method=payment_method
+        ).execution_options(synchronize_session=False)
+        if db.get_bind().dialect.update_returning:
+            claimed.update(sale_id for (sale_id,) in db.execute(statement.returning(Sale.id)))
+            continue
+        # MySQL has no UPDATE ... RETURNING; lock the still-pending rows first
+        pending = [sale_id for (sale_id,) in db.query(Sale.id).filter(
+            Sale.id.in_(chunk), Sale.is_settled == False
+        ).with_for_update().all()]
+        if pending:
+            db.execute(statement.where(Sale.id.in_(pending)))
+            claimed.update(pending)
+    return claimed
+
+def notify_dashboard(event_type: str, data: dict):
+    """Publish a committed change to the dashboard stream, with today's running totals when anyone is watching"""
+    if broadcaster.subscriber_count:
+        data["today"] = today_counters.snapshot()
+    broadcaster.publish(event_type, data)
+
 @router.get("/", response_model=List[SaleResponse])
 async def get_sales(
     page: int = 1,
     per_page: int = 50,
-    db: Session = Depends(get_db),
+    response_format: str = Query("full", alias="format"),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_any_role_user)
 ):
-    """Get all sales with pagination for better performance."""
+    """Get all sales with pagination for better performance.
+
+    Pass format=compact for a columnar payload (keys once, one array per column).
+    """
+    check_response_format(response_format)
+    
     # Calculate offset
     offset = (page - 1) * per_page
     
     # Get sales with limit and offset for pagination
-    sales = db.query(Sale).order_by(Sale.timestamp.desc()).offset(offset).limit(per_page).all()
+    columns = SALE_COMPACT_COLUMNS if response_format == "compact" else SALE_COLUMNS
+    sales = db.query(Sale).with_entities(*columns).order_by(
+        Sale.timestamp.desc()
+    ).offset(offset).limit(per_page).all()
     
     # Use optimized response format
-    return [
-        SaleResponse(
-            id=sale.id,
-            total_price=sale.total_price,
-            payment_method=sale.payment_method,
-            is_settled=sale.is_settled,
-            timestamp=sale.timestamp.isoformat() if sale.timestamp else "",
-            room_no=sale.room_no,
-            customer_id=sale.customer_id,
-            items=[SaleItemResponse(**item) for item in sale.items] if sale.items else [],
-            payments=sale.payments if sale.payments else []
-        )
-        for sale in sales
-    ]
+    if response_format == "compact":
+        return FastJSONResponse(ResponseOptimizer.compress_sales_data(sales))
+    return FastJSONResponse(serialize_sales(sales))
 
 @router.get("/pending")
 async def get_pending_sales_summary(
     customer_id: Optional[int] = None,
+    include_sales: bool = True,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get pending sales summary for a customer or all customers."""
-    query = db.query(Sale).filter(Sale.is_settled == False)
+    """Get pending sales summary for a customer or all customers.
+
+    A customer's totals come from the maintained customer_pending_totals row,
+    so with include_sales=false the open-tab check is a single primary-key read.
+    """
     if customer_id:
-        query = query.filter(Sale.customer_id == customer_id)
+        total_pending, pending_count = get_pending_totals(db, customer_id)
+        sale_ids = []
+        if include_sales and pending_count:
+            sale_ids = [
+                sale_id for sale_id, in db.query(Sale.id).filter(
+                    Sale.customer_id == customer_id,
+                    Sale.is_settled == False
+                ).order_by(Sale.id).all()
+            ]
+        return {
+            "total_pending_amount": total_pending,
+            "pending_sales_count": pending_count,
+            "sales": sale_ids
+        }
     
-    pending_sales = query.all()
-    total_pending = sum(sale.total_price for sale in pending_sales)
+    pending_sales = db.query(Sale.id, Sale.total_price).filter(Sale.is_settled == False).all()
     
     return {
-        "total_pending_amount": total_pending,
+        "total_pending_amount": sum(total_price for _, total_price in pending_sales),
         "pending_sales_count": len(pending_sales),
-        "sales": [sale.id for sale in pending_sales]
+        "sales": [sale_id for sale_id, _ in pending_sales] if include_sales else []
     }
 
-@router.get("/{sale_id}", response_model=SaleResponse)
+@router.post("/pending/rebuild")
+async def rebuild_pending_summary(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """Rebuild every customer's pending total from the unsettled sales (admin only)."""
+    try:
+        customers = rebuild_pending_totals(db)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error rebuilding pending totals: {str(e)}")
+    
+    return {"message": "Pending totals rebuilt successfully", "customers": customers}
+
+@router.get("/pending/groups")
+async def get_pending_groups(
+    group_by: str = "customer",
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get pending sales grouped by customer or room with per-group totals, one page of groups at a time.
+
+    Groups are ordered by their key; pass next_cursor back as cursor for the
+    next page. The first page also summarises pending sales with no customer
+    (or room) under "ungrouped".
+    """
+    if group_by not in GROUP_BY_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid group_by. Must be one of: {list(GROUP_BY_OPTIONS)}")
+    
+    try:
+        return list_pending_groups(db, group_by, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/pending/groups/sales", response_model=List[SaleResponse])
+async def get_pending_group_sales(
+    group_by: str = "customer",
+    key: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    response_format: str = Query("full", alias="format"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get one group's pending sales, newest first, with keyset pagination.
+
+    key is the customer ID or room number from /pending/groups; leave it out
+    for the ungrouped sales. The next page's cursor is returned in the
+    X-Next-Cursor header.
+    """
+    check_response_format(response_format)
+    if group_by not in GROUP_BY_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid group_by. Must be one of: {list(GROUP_BY_OPTIONS)}")
+    
+    try:
+        group_key = parse_group_key(group_by, key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    column = group_column(group_by)
+    columns = SALE_COMPACT_COLUMNS if response_format == "compact" else SALE_COLUMNS
+    paginator = KeysetPaginator(
+        db.query(Sale).with_entities(*columns).filter(
+            Sale.is_settled == False,
+            column.is_(None) if group_key is None else column == group_key
+        ),
+        Sale.timestamp,
+        Sale.id,
+        limit=limit,
+        cursor=cursor
+    )
+    try:
+        page = paginator.paginate()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    headers = {"X-Next-Cursor": page["next_cursor"]} if page["next_cursor"] else None
+    if response_format == "compact":
+        return FastJSONResponse(ResponseOptimizer.compress_sales_data(page["items"]), headers=headers)
+    return FastJSONResponse(serialize_sales(page["items"]), headers=headers)
+
+@router.get("/{sale_id:int}", response_model=SaleResponse)
 async def get_sale(
     sale_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get a specific sale by ID."""
-    sale = db.query(Sale).filter(Sale.id == sale_id).first()
+    """Get a specific sale by ID (archived sales included)."""
+    sale = db.query(Sale).filter(Sale.id == sale_id).first() or db.get(ArchivedSale, sale_id)
     if not sale:
         raise HTTPException(status_code=404, detail="Sale not found")
     
@@ -157,12 +308,24 @@ async def get_sale(
 @router.post("/", response_model=SaleResponse, status_code=status.HTTP_201_CREATED)
 async def create_sale(
     sale: SaleCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_any_role_user)
 ):
-    """Create a new sale with full validation and proper error handling."""
+    """Create a new sale with full validation and proper error handling.
+
+    A retried request with the same Idempotency-Key header gets the stored
+    response of the original sale instead of creating another one.
+    """
     start_time = time.time()
     
+    if idempotency_key is not None:
+        validate_key(idempotency_key)
+        fingerprint = request_fingerprint(sale)
+        stored_response = get_stored_response(db, idempotency_key, "create_sale", fingerprint)
+        if stored_response:
+            return stored_response
+    
     try:
         # Verify customer exists (only if customer_id is provided)
         customer = None
@@ -205,25 +368,17 @@ async def create_sale(
             # Update product stock
             product.stock -= item.quantity
         
-        # For card payments, check customer balance (customer must be provided)
+        # For card payments, customer must be provided
+        discounted_price = total_price
         if sale.payment_method == "card":
             if not customer:
                 raise HTTPException(status_code=400, detail="Customer is required for card payments")
             
             # Calculate discounted price if customer has a discount
-            discounted_price = total_price
             if customer.card_discount and customer.card_discount > 0:
                 discount_amount = total_price * (customer.card_discount / 100)
                 discounted_price = total_price - discount_amount
                 print(f"💳 Applying {customer.card_discount}% discount: PKR {total_price:.2f} → PKR {discounted_price:.2f}")
-            
-            if customer.balance < discounted_price:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Insufficient balance. Customer balance: {customer.balance}, Sale total: {discounted_price}"
-                )
-            # Deduct discounted amount from customer balance
-            customer.balance -= discounted_price
         
         # Create sale record with enhanced data
         db_sale = Sale(
@@ -237,12 +392,61 @@ async def create_sale(
         )
         
         db.add(db_sale)
-        db.commit()
+        db.flush()
+        
+        # Deduct discounted amount from customer balance with a conditional update
+        if sale.payment_method == "card":
+            try:
+                debit_balance(db, customer.id, discounted_price, "sale", sale_id=db_sale.id)
+            except InsufficientBalanceError as e:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Insufficient balance. Customer balance: {e.balance}, Sale total: {discounted_price}"
+                )
+        
         db.refresh(db_sale)
         
+        # Keep the customer's open tab, lifetime totals and product rollup in the same transaction as the sale
+        if db_sale.is_settled:
+            record_customer_purchases(db, db_sale.customer_id, total_price, 1, db_sale.timestamp)
+            record_product_sales(db, [(db_sale.timestamp, sale_items)])
+            record_hourly_sales(db, [(db_sale.timestamp, total_price)])
+        else:
+            record_pending_change(db, db_sale.customer_id, total_price, 1)
+        
+        sale_response = SaleResponse(
+            id=db_sale.id,
+            total_price=db_sale.total_price,
+            payment_method=db_sale.payment_method,
+            is_settled=db_sale.is_settled,
+            timestamp=db_sale.timestamp.isoformat() if db_sale.timestamp else "",
+            room_no=db_sale.room_no,
+            customer_id=db_sale.customer_id,
+            items=[SaleItemResponse(**item) for item in db_sale.items] if db_sale.items else [],
+            payments=db_sale.payments if db_sale.payments else []
+        )
+        
+        # Store the response in the same transaction as the sale
+        if idempotency_key is not None:
+            save_response(db, idempotency_key, "create_sale", fingerprint, status.HTTP_201_CREATED, sale_response)
+        
+        db.commit()
+        
         end_time = time.time()
         print(f"💰 Sale created successfully in {end_time - start_time:.3f}s - Total: PKR {total_price}")
         
+        today_counters.record_sale_created(total_price, sale_response.payment_method, sale_response.is_settled, sale_response.timestamp)
+        notify_dashboard("sale_created", {
+            "id": sale_response.id,
+            "total_price": total_price,
+            "charged_amount": discounted_price,
+            "payment_method": sale_response.payment_method,
+            "is_settled": sale_response.is_settled,
+            "customer_id": sale_response.customer_id,
+            "room_no": sale_response.room_no,
+            "timestamp": sale_response.timestamp
+        })
+        
         # Send SMS notification for card payments with improved bank-style formatting
         if sale.payment_method == "card" and customer:
             try:
@@ -261,66 +465,38 @@ async def create_sale(
             except Exception as e:
                 print(f"Failed to send payment SMS: {str(e)}")
         
-        return SaleResponse(
-            id=db_sale.id,
-            total_price=db_sale.total_price,
-            payment_method=db_sale.payment_method,
-            is_settled=db_sale.is_settled,
-            timestamp=db_sale.timestamp.isoformat() if db_sale.timestamp else "",
-            room_no=db_sale.room_no,
-            customer_id=db_sale.customer_id,
-            items=[SaleItemResponse(**item) for item in db_sale.items] if db_sale.items else [],
-            payments=db_sale.payments if db_sale.payments else []
-        )
+        return sale_response
         
     except HTTPException:
         db.rollback()
         raise
+    except IntegrityError as e:
+        db.rollback()
+        # A concurrent retry with the same key committed first; serve its result
+        if idempotency_key is not None:
+            stored_response = get_stored_response(db, idempotency_key, "create_sale", fingerprint)
+            if stored_response:
+                return stored_response
+        raise HTTPException(status_code=500, detail=f"Error creating sale: {str(e)}")
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error creating sale: {str(e)}")
 
 @router.get("/reports/pending", response_model=List[SaleResponse])
 async def get_pending_sales(
+    response_format: str = Query("full", alias="format"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all pending sales."""
-    pending_sales = db.query(Sale).filter(Sale.is_settled == False).all()
-    return [
-        SaleResponse(
-            id=sale.id,
-            total_price=sale.total_price,
-            payment_method=sale.payment_method,
-            is_settled=sale.is_settled,
-            timestamp=sale.timestamp.isoformat() if sale.timestamp else "",
-            room_no=sale.room_no,
-            customer_id=sale.customer_id,
-            items=[SaleItemResponse(**item) for item in sale.items] if sale.items else [],
-            payments=sale.payments if sale.payments else []
-        )
-        for sale in pending_sales
-    ]
-
-@router.get("/pending")
-async def get_pending_sales_summary(
-    customer_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Get pending sales summary for a customer or all customers."""
-    query = db.query(Sale).filter(Sale.is_settled == False)
-    if customer_id:
-        query = query.filter(Sale.customer_id == customer_id)
+    """Get all pending sales. Pass format=compact for a columnar payload."""
+    check_response_format(response_format)
     
-    pending_sales = query.all()
-    total_pending = sum(sale.total_price for sale in pending_sales)
+    columns = SALE_COMPACT_COLUMNS if response_format == "compact" else SALE_COLUMNS
+    pending_sales = db.query(Sale).with_entities(*columns).filter(Sale.is_settled == False).all()
     
-    return {
-        "total_pending_amount": total_pending,
-        "pending_sales_count": len(pending_sales),
-        "sales": [sale.id for sale in pending_sales]
-    }
+    if response_format == "compact":
+        return FastJSONResponse(ResponseOptimizer.compress_sales_data(pending_sales))
+    return FastJSONResponse(serialize_sales(pending_sales))
 
 @router.put("/{sale_id}/settle", response_model=SaleResponse)
 async def settle_sale(
@@ -365,10 +541,19 @@ async def settle_sale(
             )
         
         # For card payments, validate customer balance (customer must be provided)
+        if settle_data.payment_method == "card" and not customer:
+            raise HTTPException(status_code=400, detail="Customer is required for card payments")
+        
+        # Flip the sale only if it is still pending, so a concurrent settlement cannot charge it twice
+        if not claim_pending_sales(db, [sale.id], settle_data.payment_method):
+            db.rollback()
+            sale = db.query(Sale).filter(Sale.id == sale_id).first()
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Sale #{sale_id} is already settled with {sale.payment_method if sale else 'another request'}"
+            )
+        
         if settle_data.payment_method == "card":
-            if not customer:
-                raise HTTPException(status_code=400, detail="Customer is required for card payments")
-            
             # Calculate discounted price if customer has a discount
             discounted_price = sale.total_price
             if customer.card_discount and customer.card_discount > 0:
@@ -376,15 +561,18 @@ async def settle_sale(
                 discounted_price = sale.total_price - discount_amount
                 print(f"💳 Applying {customer.card_discount}% discount: PKR {sale.total_price:.2f} → PKR {discounted_price:.2f}")
             
-            if customer.balance < discounted_price:
+            # Deduct discounted amount from customer balance with a conditional update
+            try:
+                new_balance = debit_balance(db, customer.id, discounted_price, "settlement", sale_id=sale.id)
+            except InsufficientBalanceError as e:
+                # No balance means the customer row was not found when the debit was checked
+                if e.balance is None:
+                    raise HTTPException(status_code=400, detail=f"Customer #{customer.id} could not be charged: card account not found")
                 raise HTTPException(
                     status_code=400,
-                    detail=f"Insufficient balance. Customer balance: PKR {customer.balance:.2f}, Sale total: PKR {discounted_price:.2f}. Shortfall: PKR {discounted_price - customer.balance:.2f}"
+                    detail=f"Insufficient balance. Customer balance: PKR {e.balance:.2f}, Sale total: PKR {discounted_price:.2f}. Shortfall: PKR {discounted_price - e.balance:.2f}"
                 )
-            
-            # Deduct discounted amount from customer balance
-            customer.balance -= discounted_price
-            print(f"💳 Card payment: Deducted PKR {discounted_price:.2f} from customer #{customer.id}. New balance: PKR {customer.balance:.2f}")
+            print(f"💳 Card payment: Deducted PKR {discounted_price:.2f} from customer #{customer.id}. New balance: PKR {new_balance:.2f}")
         
         # Update sale with settlement information
         sale.payment_method = settle_data.payment_method
@@ -398,16 +586,27 @@ async def settle_sale(
             "settled_at": time.time()
         }
         
-        if sale.payments:
-            sale.payments.append(settlement_record)
-        else:
-            sale.payments = [settlement_record]
+        sale.payments = (sale.payments or []) + [settlement_record]
+        record_pending_change(db, sale.customer_id, -sale.total_price, -1)
+        record_customer_purchases(db, sale.customer_id, sale.total_price, 1, sale.timestamp)
+        record_product_sales(db, [(sale.timestamp, sale.items)])
+        record_hourly_sales(db, [(sale.timestamp, sale.total_price)])
         
         db.commit()
         db.refresh(sale)
         
         print(f"✅ Sale #{sale_id} settled successfully with {settle_data.payment_method} for PKR {sale.total_price:.2f}")
         
+        today_counters.record_sales_settled([(sale.total_price, sale.timestamp)], sale.payment_method)
+        notify_dashboard("sale_settled", {
+            "id": sale.id,
+            "total_price": sale.total_price,
+            "charged_amount": discounted_price if settle_data.payment_method == "card" else sale.total_price,
+            "payment_method": sale.payment_method,
+            "customer_id": sale.customer_id,
+            "timestamp": sale.timestamp.isoformat() if sale.timestamp else ""
+        })
+        
         # Send SMS notification for card payments with improved bank-style formatting
         if settle_data.payment_method == "card" and customer:
             try:
@@ -464,15 +663,21 @@ async def settle_sale(
 @router.post("/settle-batch", response_model=BatchSettleResponse)
 async def batch_settle_sales(
     batch_request: BatchSettleSaleRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Settle multiple pending sales in batch with comprehensive validation."""
+    """Settle multiple pending sales in batch with comprehensive validation.
+
+    All target sales and their customers are loaded up front, discounts and
+    balance checks are computed in memory and the resulting sale and balance
+    updates are written in bulk within one transaction.
+    """
     if not batch_request.sale_ids:
         raise HTTPException(status_code=400, detail="No sale IDs provided")
     
-    if len(batch_request.sale_ids) > 50:
-        raise HTTPException(status_code=400, detail="Cannot settle more than 50 sales at once")
+    if len(batch_request.sale_ids) > BATCH_SETTLE_MAX_SALES:
+        raise HTTPException(status_code=400, detail=f"Cannot settle more than {BATCH_SETTLE_MAX_SALES} sales at once")
     
     # Validate payment method
     valid_payment_methods = ["cash", "card", "easypaisa"]
@@ -485,148 +690,247 @@ async def batch_settle_sales(
     settled_sales = []
     failed_sales = []
     total_settled_amount = 0.0
+    is_card = batch_request.payment_method == "card"
     
-    # For card payments, pre-validate all customer balances
-    if batch_request.payment_method == "card":
-        customer_balances = {}
-        customer_required = {}
-        
-        for sale_id in batch_request.sale_ids:
-            sale = db.query(Sale).filter(Sale.id == sale_id).first()
-            if sale and not sale.is_settled:
-                customer_id = sale.customer_id
-                if customer_id not in customer_balances:
-                    customer = db.query(Customer).filter(Customer.id == customer_id).first()
-                    if not customer:
-                        failed_sales.append({"sale_id": sale_id, "error": "Customer not found"})
-                        continue
-                    
-                    # Store customer and their current balance
-                    customer_balances[customer_id] = customer.balance
-                    customer_required[customer_id] = customer
-                
-                # Calculate discounted price if customer has a discount
-                discounted_price = sale.total_price
-                customer = customer_required[customer_id]
-                if customer.card_discount and customer.card_discount > 0:
-                    discount_amount = sale.total_price * (customer.card_discount / 100)
-                    discounted_price = sale.total_price - discount_amount
-                    print(f"💳 Applying {customer.card_discount}% discount: PKR {sale.total_price:.2f} → PKR {discounted_price:.2f}")
-                
-                # Check if customer has sufficient balance
-                if customer_balances[customer_id] < discounted_price:
-                    failed_sales.append({
-                        "sale_id": sale_id, 
-                        "error": f"Insufficient balance. Customer balance: PKR {customer_balances[customer_id]:.2f}, Sale total: PKR {discounted_price:.2f}"
-                    })
-                    continue
-                
-                # Deduct from customer balance
-                customer_balances[customer_id] -= discounted_price
-                total_settled_amount += discounted_price
-                print(f"💳 Card payment: Deducted PKR {discounted_price:.2f} from customer #{customer_id}. New balance: PKR {customer_balances[customer_id]:.2f}")
+    # Load every target sale in one (chunked) query
+    sales_by_id = {}
+    for chunk in chunked(set(batch_request.sale_ids)):
+        sales_by_id.update((sale.id, sale) for sale in db.query(Sale).filter(Sale.id.in_(chunk)).all())
+    
+    # Load the customers of those sales in one query (card payments only)
+    customers_by_id = {}
+    if is_card:
+        customer_ids = {sale.customer_id for sale in sales_by_id.values() if sale.customer_id and not sale.is_settled}
+        for chunk in chunked(customer_ids):
+            customers_by_id.update(
+                (customer.id, customer) for customer in db.query(Customer).filter(Customer.id.in_(chunk)).all()
+            )
+    
+    # Running balances so several sales of the same customer are checked cumulatively
+    customer_balances = {customer_id: customer.balance for customer_id, customer in customers_by_id.items()}
+    sale_updates = []
+    charged_amounts = {}  # sale_id -> discounted amount deducted from the card
+    seen_sale_ids = set()
+    settled_at = time.time()
     
-    # Process each sale
     for sale_id in batch_request.sale_ids:
-        # Skip if already failed in pre-validation
-        if any(f["sale_id"] == sale_id for f in failed_sales):
+        if sale_id in seen_sale_ids:
+            failed_sales.append({"sale_id": sale_id, "error": "Duplicate sale ID in request"})
             continue
+        seen_sale_ids.add(sale_id)
         
-        try:
-            # Get the sale
-            sale = db.query(Sale).filter(Sale.id == sale_id).first()
-            if not sale:
-                failed_sales.append({"sale_id": sale_id, "error": "Sale not found"})
-                continue
-                
-            if sale.is_settled:
-                failed_sales.append({"sale_id": sale_id, "error": f"Sale is already settled with {sale.payment_method}"})
+        sale = sales_by_id.get(sale_id)
+        if not sale:
+            failed_sales.append({"sale_id": sale_id, "error": "Sale not found"})
+            continue
+        
+        if sale.is_settled:
+            failed_sales.append({"sale_id": sale_id, "error": f"Sale is already settled with {sale.payment_method}"})
+            continue
+        
+        if batch_request.customer_id and sale.customer_id != batch_request.customer_id:
+            failed_sales.append({
+                "sale_id": sale_id,
+                "error": f"Sale belongs to customer #{sale.customer_id}, not #{batch_request.customer_id}"
+            })
+            continue
+        
+        amount = sale.total_price
+        if is_card:
+            customer = customers_by_id.get(sale.customer_id)
+            if not customer:
+                failed_sales.append({"sale_id": sale_id, "error": "Customer not found"})
                 continue
             
-            # For card payments, deduct from customer balance
-            if batch_request.payment_method == "card":
-                customer = db.query(Customer).filter(Customer.id == sale.customer_id).first()
-                if not customer:
-                    failed_sales.append({"sale_id": sale_id, "error": "Customer not found"})
-                    continue
-                
-                if customer.balance < sale.total_price:
-                    failed_sales.append({
-                        "sale_id": sale_id, 
-                        "error": f"Insufficient balance. Customer balance: PKR {customer.balance:.2f}, Sale total: PKR {sale.total_price:.2f}"
-                    })
-                    continue
-                
-                # Deduct from customer balance
-                customer.balance -= sale.total_price
-            
-            # Update sale with settlement information
-            sale.payment_method = batch_request.payment_method
-            sale.is_settled = True
-            
-            # Add settlement metadata
-            settlement_record = {
-                "method": batch_request.payment_method,
-                "amount": sale.total_price,
-                "settled_by": current_user.username,
-                "settled_at": time.time(),
-                "batch_settlement": True
-            }
-            
-            if sale.payments:
-                sale.payments.append(settlement_record)
-            else:
-                sale.payments = [settlement_record]
+            # Calculate discounted price if customer has a discount
+            if customer.card_discount and customer.card_discount > 0:
+                amount = sale.total_price - sale.total_price * (customer.card_discount / 100)
             
-            settled_sales.append(sale_id)
-            total_settled_amount += sale.total_price
+            # Check if customer has sufficient balance
+            if customer_balances[customer.id] < amount:
+                failed_sales.append({
+                    "sale_id": sale_id, 
+                    "error": f"Insufficient balance. Customer balance: PKR {customer_balances[customer.id]:.2f}, Sale total: PKR {amount:.2f}"
+                })
+                continue
             
-        except Exception as e:
-            failed_sales.append({"sale_id": sale_id, "error": f"Processing error: {str(e)}"})
+            customer_balances[customer.id] -= amount
+            charged_amounts[sale_id] = amount
+        
+        # Add settlement metadata
+        settlement_record = {
+            "method": batch_request.payment_method,
+            "amount": sale.total_price,
+            "settled_by": current_user.username,
+            "settled_at": settled_at,
+            "batch_settlement": True
+        }
+        
+        sale_updates.append({
+            "id": sale_id,
+            "payment_method": batch_request.payment_method,
+            "is_settled": True,
+            "payments": (sale.payments or []) + [settlement_record]
+        })
+        settled_sales.append(sale_id)
+        total_settled_amount += amount
+    
+    if not settled_sales:
+        db.rollback()
+        print("⚠️ Batch settlement: No sales were settled")
+        return BatchSettleResponse(
+            settled_count=0,
+            failed_count=len(failed_sales),
+            settled_sales=[],
+            failed_sales=failed_sales
+        )
     
-    # Commit all successful settlements
+    # Apply all settlements and balance deductions in one transaction
     try:
-        if settled_sales:
-            db.commit()
-            print(f"✅ Batch settlement completed: {len(settled_sales)} sales settled for PKR {total_settled_amount:.2f} via {batch_request.payment_method}")
-            
-            # Send SMS notifications for card payments with improved bank-style formatting
-            if batch_request.payment_method == "card":
-                # Get all settled sales with customer info
-                settled_sale_records = db.query(Sale).filter(Sale.id.in_(settled_sales)).all()
-                for sale in settled_sale_records:
-                    if sale.customer_id:
-                        customer = db.query(Customer).filter(Customer.id == sale.customer_id).first()
-                        if customer:
-                            # Update customer balance in database
-                            customer.balance = customer_balances[sale.customer_id]
-                            
-                            try:
-                                # Get products for SMS formatting
-                                product_ids = [item["product_id"] for item in sale.items]
-                                products = db.query(Product).filter(Product.id.in_(product_ids)).all()
-                                items_text = format_items_for_sms(sale.items, products)
-                                
-                                # Calculate discounted price for SMS
-                                discounted_price = sale.total_price
-                                discount_info = ""
-                                if customer.card_discount and customer.card_discount > 0:
-                                    discount_amount = sale.total_price * (customer.card_discount / 100)
-                                    discounted_price = sale.total_price - discount_amount
-                                    discount_info = f"\nDisc: {customer.card_discount}% (-PKR {discount_amount:.2f})"
-                                
-                                # Improved bank-style SMS format
-                                message = f"DEBIT\nCafe D Revenue\nBill #{sale.id} Settled\nPKR {sale.total_price:.2f}{discount_info}\nBal: PKR {customer.balance:.2f}\n{items_text}"
-                                sms_service.send_sms(customer.phone, message)
-                            except Exception as e:
-                                print(f"Failed to send batch settlement SMS: {str(e)}")
-        else:
-            db.rollback()
-            print("⚠️ Batch settlement: No sales were settled")
+        # Flip the sales that are still pending; any a concurrent settlement got
+        # to first since they were read are reported instead of charged again
+        claimed = claim_pending_sales(db, settled_sales, batch_request.payment_method)
+        for sale_id in [sale_id for sale_id in settled_sales if sale_id not in claimed]:
+            settled_sales.remove(sale_id)
+            total_settled_amount -= charged_amounts.pop(sale_id, sales_by_id[sale_id].total_price)
+            failed_sales.append({"sale_id": sale_id, "error": "Sale is already settled"})
+        
+        # One conditional debit per customer; if a concurrent payment drained
+        # the card since it was read, that customer's sales are put back to pending
+        charges_by_customer = {}
+        for sale_id in settled_sales:
+            if sale_id in charged_amounts:
+                charges_by_customer.setdefault(sales_by_id[sale_id].customer_id, []).append(
+                    {"sale_id": sale_id, "amount": charged_amounts[sale_id]}
+                )
+        
+        final_balances = {}
+        reverted = []
+        for customer_id, charges in list(charges_by_customer.items()):
+            try:
+                final_balances[customer_id] = debit_sales_batch(db, customer_id, charges, "batch_settlement")
+            except InsufficientBalanceError as e:
+                del charges_by_customer[customer_id]
+                for charge in charges:
+                    reverted.append({
+                        "id": charge["sale_id"],
+                        "is_settled": False,
+                        "payment_method": sales_by_id[charge["sale_id"]].payment_method
+                    })
+                    settled_sales.remove(charge["sale_id"])
+                    del charged_amounts[charge["sale_id"]]
+                    total_settled_amount -= charge["amount"]
+                    failed_sales.append({
+                        "sale_id": charge["sale_id"],
+                        "error": "Customer card account not found" if e.balance is None else
+                            f"Insufficient balance. Customer balance: PKR {e.balance:.2f}, Sale total: PKR {charge['amount']:.2f}"
+                    })
+        
+        # The claimed rows stay locked by this transaction, so updating them by primary key is safe
+        for chunk in chunked(reverted):
+            db.execute(update(Sale), chunk)
+        settled_set = set(settled_sales)
+        sale_updates = [values for values in sale_updates if values["id"] in settled_set]
+        for chunk in chunked(sale_updates):
+            db.execute(update(Sale), chunk)
+        
+        # One open-tab and lifetime-total adjustment per customer
+        customer_changes = {}
+        for sale_id in settled_sales:
+            sale = sales_by_id[sale_id]
+            if sale.customer_id is not None:
+                amount, count, last_purchase_at = customer_changes.get(sale.customer_id, (0.0, 0, sale.timestamp))
+                customer_changes[sale.customer_id] = (
+                    amount + sale.total_price, count + 1, max(last_purchase_at, sale.timestamp)
+                )
+        for customer_id, (amount, count, last_purchase_at) in customer_changes.items():
+            record_pending_change(db, customer_id, -amount, -count)
+            record_customer_purchases(db, customer_id, amount, count, last_purchase_at)
+        record_product_sales(db, [(sales_by_id[sale_id].timestamp, sales_by_id[sale_id].items) for sale_id in settled_sales])
+        record_hourly_sales(db, [(sales_by_id[sale_id].timestamp, sales_by_id[sale_id].total_price) for sale_id in settled_sales])
+        
+        # Plain values for the notifications below, so nothing is reloaded row by row after the commit
+        settled_info = {
+            sale_id: {
+                "total_price": sales_by_id[sale_id].total_price,
+                "timestamp": sales_by_id[sale_id].timestamp,
+                "items": sales_by_id[sale_id].items or [],
+                "customer_id": sales_by_id[sale_id].customer_id
+            }
+            for sale_id in settled_sales
+        }
+        customer_info = {
+            customer_id: {"phone": customer.phone, "card_discount": customer.card_discount}
+            for customer_id, customer in customers_by_id.items()
+        }
+        db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error committing batch settlement: {str(e)}")
     
+    if not settled_sales:
+        print("⚠️ Batch settlement: No sales were settled")
+        return BatchSettleResponse(
+            settled_count=0,
+            failed_count=len(failed_sales),
+            settled_sales=[],
+            failed_sales=failed_sales
+        )
+    
+    print(f"✅ Batch settlement completed: {len(settled_sales)} sales settled for PKR {total_settled_amount:.2f} via {batch_request.payment_method}")
+    
+    today_counters.record_sales_settled(
+        [(settled_info[sale_id]["total_price"], settled_info[sale_id]["timestamp"]) for sale_id in settled_sales],
+        batch_request.payment_method
+    )
+    notify_dashboard("sales_batch_settled", {
+        "sale_ids": settled_sales,
+        "count": len(settled_sales),
+        "total_price": sum(settled_info[sale_id]["total_price"] for sale_id in settled_sales),
+        "charged_amount": total_settled_amount,
+        "payment_method": batch_request.payment_method,
+        "customer_id": batch_request.customer_id
+    })
+    
+    # Queue card settlement SMS notifications as one bulk job
+    if is_card and charged_amounts:
+        product_ids = {
+            item["product_id"]
+            for sale_id in charged_amounts
+            for item in settled_info[sale_id]["items"]
+        }
+        products = []
+        for chunk in chunked(product_ids):
+            products.extend(db.query(Product).filter(Product.id.in_(chunk)).all())
+        
+        # Walk each customer's balance forward to what it was after every sale
+        running_balances = {
+            customer_id: final_balances[customer_id] + sum(charge["amount"] for charge in charges_by_customer[customer_id])
+            for customer_id in final_balances
+        }
+        messages = []
+        for sale_id in settled_sales:
+            if sale_id not in charged_amounts:
+                continue
+            sale = settled_info[sale_id]
+            customer_id = sale["customer_id"]
+            customer = customer_info[customer_id]
+            running_balances[customer_id] -= charged_amounts[sale_id]
+            
+            discount_info = ""
+            if customer["card_discount"] and customer["card_discount"] > 0:
+                discount_amount = sale["total_price"] * (customer["card_discount"] / 100)
+                discount_info = f"\nDisc: {customer['card_discount']}% (-PKR {discount_amount:.2f})"
+            
+            items_text = format_items_for_sms(sale["items"], products)
+            messages.append({
+                "contact": customer["phone"],
+                "message": f"DEBIT\nCafe D Revenue\nBill #{sale_id} Settled\nPKR {sale['total_price']:.2f}{discount_info}\nBal: PKR {running_balances[customer_id]:.2f}\n{items_text}",
+                "type": "text"
+            })
+        
+        background_tasks.add_task(sms_service.send_bulk_sms_batched, messages)
+    
     return BatchSettleResponse(
         settled_count=len(settled_sales),
         failed_count=len(failed_sales),
@@ -637,10 +941,22 @@ async def batch_settle_sales(
 @router.post("/recharge", response_model=RechargeResponse, status_code=status.HTTP_201_CREATED)
 async def recharge_customer(
     recharge: RechargeRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Recharge customer balance."""
+    """Recharge customer balance.
+
+    A retried request with the same Idempotency-Key header gets the stored
+    response of the original recharge instead of crediting the card again.
+    """
+    if idempotency_key is not None:
+        validate_key(idempotency_key)
+        fingerprint = request_fingerprint(recharge)
+        stored_response = get_stored_response(db, idempotency_key, "recharge_customer", fingerprint)
+        if stored_response:
+            return stored_response
+    
     customer = db.query(Customer).filter(Customer.id == recharge.customer_id).first()
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
@@ -648,10 +964,6 @@ async def recharge_customer(
     if recharge.amount <= 0:
         raise HTTPException(status_code=400, detail="Recharge amount must be positive")
     
-    # Update customer balance
-    old_balance = customer.balance
-    customer.balance += recharge.amount
-    
     # Create recharge transaction record
     recharge_transaction = RechargeTransaction(
         customer_id=recharge.customer_id,
@@ -659,8 +971,39 @@ async def recharge_customer(
     )
     
     db.add(recharge_transaction)
-    db.commit()
+    db.flush()
+    
+    # Update customer balance atomically and record it in the ledger
+    credit_balance(db, customer.id, recharge.amount, "recharge", recharge_id=recharge_transaction.id)
+    
+    # Keep the daily recharge rollup in step with the raw table
     db.refresh(recharge_transaction)
+    record_recharge(db, recharge_transaction.recharge_date, recharge.amount)
+    
+    recharge_response = RechargeResponse(
+        id=recharge_transaction.id,
+        customer_id=recharge_transaction.customer_id,
+        amount=recharge_transaction.amount,
+        recharge_date=recharge_transaction.recharge_date.isoformat() if recharge_transaction.recharge_date else ""
+    )
+    
+    # Store the response in the same transaction as the recharge
+    if idempotency_key is not None:
+        save_response(db, idempotency_key, "recharge_customer", fingerprint, status.HTTP_201_CREATED, recharge_response)
+    
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        # A concurrent retry with the same key committed first; serve its result
+        if idempotency_key is not None:
+            stored_response = get_stored_response(db, idempotency_key, "recharge_customer", fingerprint)
+            if stored_response:
+                return stored_response
+        raise
+    
+    today_counters.record_recharge(recharge.amount, recharge_transaction.recharge_date)
+    notify_dashboard("recharge", jsonable_encoder(recharge_response))
     
     # Send SMS notification for recharge with improved bank-style formatting
     try:
@@ -674,54 +1017,120 @@ async def recharge_customer(
     except Exception as e:
         print(f"Failed to send recharge SMS: {str(e)}")
     
-    return RechargeResponse(
-        id=recharge_transaction.id,
-        customer_id=recharge_transaction.customer_id,
-        amount=recharge_transaction.amount,
-        recharge_date=recharge_transaction.recharge_date.isoformat() if recharge_transaction.recharge_date else ""
-    )
+    return recharge_response
 
 @router.get("/recharge", response_model=List[RechargeResponse])
 async def get_all_recharges(
-    db: Session = Depends(get_db),
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    response_format: str = Query("full", alias="format"),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_admin_or_manager_user)
 ):
-    """Get all recharge transactions."""
-    recharges = db.query(RechargeTransaction).order_by(
-        RechargeTransaction.recharge_date.desc()
-    ).all()
-    
-    return [
-        RechargeResponse(
-            id=recharge.id,
-            customer_id=recharge.customer_id,
-            amount=recharge.amount,
-            recharge_date=recharge.recharge_date.isoformat() if recharge.recharge_date else ""
-        )
-        for recharge in recharges
-    ]
+    """Get recharge transactions, newest first, one page at a time.
+
+    When more rows exist the X-Next-Cursor response header holds the cursor for the next page.
+    Pass format=compact for a columnar payload.
+    """
+    check_response_format(response_format)
+    
+    paginator = KeysetPaginator(
+        db.query(RechargeTransaction).with_entities(*(RECHARGE_COMPACT_COLUMNS if response_format == "compact" else RECHARGE_COLUMNS)),
+        RechargeTransaction.recharge_date,
+        RechargeTransaction.id,
+        limit=limit,
+        cursor=cursor
+    )
+    try:
+        page = paginator.paginate()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    headers = {"X-Next-Cursor": page["next_cursor"]} if page["next_cursor"] else None
+    if response_format == "compact":
+        return FastJSONResponse(ResponseOptimizer.compress_recharge_data(page["items"]), headers=headers)
+    return FastJSONResponse(serialize_recharges(page["items"]), headers=headers)
+
+@router.get("/recharge/summary")
+async def get_recharge_summary(
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    granularity: str = "day",
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_admin_or_manager_user)
+):
+    """Get recharge totals per day, week or month from the daily recharge rollup."""
+    if granularity not in ("day", "week", "month"):
+        raise HTTPException(status_code=400, detail="Granularity must be one of: day, week, month")
+    
+    # Default to last 30 business days if no dates provided
+    if not from_date or not to_date:
+        today = business_today()
+        from_date = from_date or today - timedelta(days=30)
+        to_date = to_date or today
+    
+    buckets = summarize_recharges(db, from_date, to_date, granularity)
+    
+    return {
+        "date_range": f"{from_date} to {to_date}",
+        "granularity": granularity,
+        "periods": buckets,
+        "summary": {
+            "total_amount": sum(bucket["total_amount"] for bucket in buckets),
+            "recharge_count": sum(bucket["recharge_count"] for bucket in buckets)
+        }
+    }
+
+@router.post("/recharge/summary/rebuild")
+async def rebuild_recharge_summary(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """Rebuild the daily recharge rollup from the raw recharge transactions (admin only)."""
+    try:
+        days = rebuild_recharge_rollup(db)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error rebuilding recharge rollup: {str(e)}")
+    
+    return {"message": "Recharge rollup rebuilt successfully", "days": days}
 
 @router.get("/recharge/history/{customer_id}", response_model=List[RechargeResponse])
 async def get_recharge_history(
     customer_id: int,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    response_format: str = Query("full", alias="format"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get recharge history for a customer."""
+    """Get recharge history for a customer, newest first, one page at a time.
+
+    When more rows exist the X-Next-Cursor response header holds the cursor for the next page.
+    Pass format=compact for a columnar payload.
+    """
+    check_response_format(response_format)
+    
     customer = db.query(Customer).filter(Customer.id == customer_id).first()
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    recharges = db.query(RechargeTransaction).filter(
-        RechargeTransaction.customer_id == customer_id
-    ).order_by(RechargeTransaction.recharge_date.desc()).all()
+    paginator = KeysetPaginator(
+        db.query(RechargeTransaction).with_entities(*(RECHARGE_COMPACT_COLUMNS if response_format == "compact" else RECHARGE_COLUMNS)).filter(
+            RechargeTransaction.customer_id == customer_id
+        ),
+        RechargeTransaction.recharge_date,
+        RechargeTransaction.id,
+        limit=limit,
+        cursor=cursor
+    )
+    try:
+        page = paginator.paginate()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return [
-        RechargeResponse(
-            id=recharge.id,
-            customer_id=recharge.customer_id,
-            amount=recharge.amount,
-            recharge_date=recharge.recharge_date.isoformat() if recharge.recharge_date else ""
-        )
-        for recharge in recharges
-    ]
\ No newline at end of file
+    headers = {"X-Next-Cursor": page["next_cursor"]} if page["next_cursor"] else None
+    if response_format == "compact":
+        return FastJSONResponse(ResponseOptimizer.compress_recharge_data(page["items"]), headers=headers)
+    return FastJSONResponse(serialize_recharges(page["items"]), headers=headers)
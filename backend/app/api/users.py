@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
 
-from ..db.database import get_db
+from ..db.database import get_db, get_read_db
 from ..models.user import User
 from ..api.auth import get_current_user, get_admin_user
 from ..core.security import get_password_hash
@@ -46,7 +46,7 @@ def check_admin_or_manager(current_user: User):
 
 @router.get("/", response_model=List[UserResponse])
 async def get_users(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_admin_user)
 ):
     """Get all users (admin and manager only)"""
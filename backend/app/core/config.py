@@ -36,6 +36,52 @@ class Settings:
     DEBUG: bool = config("DEBUG", default=False, cast=bool)
     LOG_LEVEL: str = config("LOG_LEVEL", default="INFO")
     
+    # Optional read replica for reports, dashboards and list endpoints. A client that
+    # has just written reads from the primary for READ_AFTER_WRITE_SECONDS; an
+    # unreachable replica is skipped for READ_REPLICA_RETRY_SECONDS
+    DATABASE_READ_URL: str = config("DATABASE_READ_URL", default="")
+    READ_AFTER_WRITE_SECONDS: int = config("READ_AFTER_WRITE_SECONDS", default=10, cast=int)
+    READ_REPLICA_RETRY_SECONDS: int = config("READ_REPLICA_RETRY_SECONDS", default=30, cast=int)
+    
+    # Run create_all on every process start. Turn off on Passenger and run
+    # `python -m app.db.init_db` on deploy instead, so spawns skip the schema check
+    CREATE_TABLES_ON_STARTUP: bool = config("CREATE_TABLES_ON_STARTUP", default=True, cast=bool)
+    
+    # Response compression (gzip, plus brotli when the brotli package is installed)
+    COMPRESSION_ENABLED: bool = config("COMPRESSION_ENABLED", default=True, cast=bool)
+    COMPRESSION_MINIMUM_SIZE: int = config("COMPRESSION_MINIMUM_SIZE", default=1024, cast=int)
+    COMPRESSION_LEVEL: int = config("COMPRESSION_LEVEL", default=6, cast=int)
+    BROTLI_QUALITY: int = config("BROTLI_QUALITY", default=4, cast=int)
+    
+    # Idempotency-Key retention for POS retries
+    IDEMPOTENCY_TTL_HOURS: int = config("IDEMPOTENCY_TTL_HOURS", default=24, cast=int)
+    
+    # Product image uploads (thumbnails need the optional Pillow package)
+    UPLOAD_DIR: str = config("UPLOAD_DIR", default="uploads")
+    MAX_IMAGE_UPLOAD_MB: int = config("MAX_IMAGE_UPLOAD_MB", default=5, cast=int)
+    IMAGE_WORKERS: int = config("IMAGE_WORKERS", default=2, cast=int)
+    
+    # In-memory "today" dashboard counters are reloaded from the database this often
+    # so writes handled by other worker processes show up (0 = only at midnight)
+    TODAY_COUNTERS_RESYNC_SECONDS: int = config("TODAY_COUNTERS_RESYNC_SECONDS", default=60, cast=int)
+    
+    # Background report jobs: worker threads per process, how long finished results
+    # are kept, and when a job that stopped reporting progress is considered lost
+    REPORT_JOB_WORKERS: int = config("REPORT_JOB_WORKERS", default=1, cast=int)
+    REPORT_JOB_RETENTION_HOURS: int = config("REPORT_JOB_RETENTION_HOURS", default=24, cast=int)
+    REPORT_JOB_TIMEOUT_MINUTES: int = config("REPORT_JOB_TIMEOUT_MINUTES", default=30, cast=int)
+    
+    # Settled sales older than ARCHIVE_AFTER_DAYS are moved to sales_archive by
+    # `python -m app.db.archive_sales`, ARCHIVE_BATCH_SIZE rows per transaction
+    ARCHIVE_AFTER_DAYS: int = config("ARCHIVE_AFTER_DAYS", default=365, cast=int)
+    ARCHIVE_BATCH_SIZE: int = config("ARCHIVE_BATCH_SIZE", default=1000, cast=int)
+    
+    # Reports bucket sales by hour and weekday in BUSINESS_TIMEZONE (IANA name or
+    # fixed offset like +05:00). Naive timestamps from the database are read as
+    # DATABASE_TIMEZONE (SQLite's CURRENT_TIMESTAMP is UTC)
+    BUSINESS_TIMEZONE: str = config("BUSINESS_TIMEZONE", default="Asia/Karachi")
+    DATABASE_TIMEZONE: str = config("DATABASE_TIMEZONE", default="UTC")
+    
     # SMS settings
     SMS_API_KEY: str = config("SMS_API_KEY", default="")
     SMS_SENDER_ID: str = config("SMS_SENDER_ID", default="")
@@ -0,0 +1,58 @@
+"""
+Routers for rarely used areas (reports, settings) imported on the first request
+under their prefix instead of at application import, which keeps cold starts
+short when Passenger spawns a process for a POS request. The OpenAPI schema
+loads every pending router first, so /docs still lists all endpoints.
+"""
+
+import importlib
+from typing import Dict, Tuple
+
+from fastapi import FastAPI
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+class LazyRouters:
+    def __init__(self, app: FastAPI, package: str):
+        self.app = app
+        self.package = package
+        self.pending: Dict[str, Tuple[str, dict]] = {}
+
+        generate_openapi = app.openapi
+
+        def openapi():
+            self.load_all()
+            return generate_openapi()
+
+        app.openapi = openapi
+        app.add_middleware(LazyRouterMiddleware, routers=self)
+
+    def register(self, module: str, prefix: str, **include_kwargs):
+        """Include `<module>.router` at prefix once a request needs it"""
+        self.pending[prefix] = (module, include_kwargs)
+
+    def load(self, prefix: str):
+        entry = self.pending.pop(prefix, None)
+        if entry is None:
+            return
+        module, include_kwargs = entry
+        router = importlib.import_module(module, package=self.package).router
+        self.app.include_router(router, prefix=prefix, **include_kwargs)
+
+    def load_for_path(self, path: str):
+        for prefix in list(self.pending):
+            if path == prefix or path.startswith(prefix + "/"):
+                self.load(prefix)
+
+    def load_all(self):
+        for prefix in list(self.pending):
+            self.load(prefix)
+
+class LazyRouterMiddleware:
+    def __init__(self, app: ASGIApp, routers: LazyRouters):
+        self.app = app
+        self.routers = routers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if self.routers.pending and scope["type"] == "http":
+            self.routers.load_for_path(scope["path"])
+        await self.app(scope, receive, send)
@@ -2,10 +2,13 @@
 Performance optimization utilities for faster API responses
 """
 
+import base64
 import functools
+import json
 import time
-from typing import Any, Callable, Dict
+from typing import Any, Callable, Dict, Optional
 from datetime import datetime, timedelta
+from sqlalchemy import or_, and_, literal, String
 
 # Simple in-memory cache
 _cache: Dict[str, Dict[str, Any]] = {}
@@ -78,6 +81,76 @@ class Paginator:
             'has_next': self.page * self.per_page < total
         }
 
+def keyset_time_param(session, value: datetime):
+    """
+    Bind a cursor timestamp so equality works against stored values.
+    SQLite keeps server-default timestamps as 'YYYY-MM-DD HH:MM:SS' text while
+    SQLAlchemy binds datetimes with microseconds, so compare as text there.
+    """
+    if session.get_bind().dialect.name == "sqlite":
+        fmt = "%Y-%m-%d %H:%M:%S.%f" if value.microsecond else "%Y-%m-%d %H:%M:%S"
+        return literal(value.strftime(fmt), String)
+    return value
+
+# Keyset (cursor) pagination utility
+class KeysetPaginator:
+    """
+    Cursor pagination over (time_column, id_column) DESC. Unlike offset paging,
+    every page is a single index range scan however deep the client pages.
+    """
+    def __init__(self, query, time_column, id_column, limit: int = 50, cursor: Optional[str] = None, max_limit: int = 500):
+        self.query = query
+        self.time_column = time_column
+        self.id_column = id_column
+        self.limit = min(max_limit, max(1, limit))
+        self.cursor = cursor
+
+    @staticmethod
+    def encode_cursor(timestamp: datetime, row_id: int) -> str:
+        payload = json.dumps([timestamp.isoformat() if timestamp else None, row_id])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        """Return (timestamp, id) or raise ValueError"""
+        try:
+            timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            return datetime.fromisoformat(timestamp), int(row_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    def paginate(self):
+        query = self.query
+        if self.cursor:
+            cursor_time, cursor_id = self.decode_cursor(self.cursor)
+            cursor_time = keyset_time_param(query.session, cursor_time)
+            query = query.filter(or_(
+                self.time_column < cursor_time,
+                and_(self.time_column == cursor_time, self.id_column < cursor_id)
+            ))
+
+        rows = query.order_by(self.time_column.desc(), self.id_column.desc()).limit(self.limit + 1).all()
+        items = rows[:self.limit]
+
+        next_cursor = None
+        if len(rows) > self.limit:
+            last = items[-1]
+            next_cursor = self.encode_cursor(
+                getattr(last, self.time_column.key), getattr(last, self.id_column.key)
+            )
+
+        return {
+            'items': items,
+            'limit': self.limit,
+            'next_cursor': next_cursor
+        }
+
+def chunked(items, size: int = 500):
+    """Yield successive chunks of at most `size` items (keeps IN lists and executemany batches bounded)"""
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
 # Performance monitoring
 def timing_decorator(func: Callable) -> Callable:
     """Decorator to measure function execution time"""
@@ -110,6 +183,14 @@ def optimize_database_indexes():
         "CREATE INDEX IF NOT EXISTS idx_sales_is_settled ON sales(is_settled);",
         "CREATE INDEX IF NOT EXISTS idx_recharge_customer_id ON recharge_transactions(customer_id);",
         "CREATE INDEX IF NOT EXISTS idx_recharge_date ON recharge_transactions(recharge_date);",
+        "CREATE INDEX IF NOT EXISTS idx_sales_customer_timestamp ON sales(customer_id, timestamp);",
+        "CREATE INDEX IF NOT EXISTS idx_recharge_customer_date ON recharge_transactions(customer_id, recharge_date);",
+        "CREATE INDEX IF NOT EXISTS idx_sales_pending_customer ON sales(is_settled, customer_id, timestamp);",
+        "CREATE INDEX IF NOT EXISTS idx_sales_pending_room ON sales(is_settled, room_no, timestamp);",
+        "CREATE INDEX IF NOT EXISTS idx_sales_archive_timestamp ON sales_archive(timestamp);",
+        "CREATE INDEX IF NOT EXISTS idx_sales_archive_customer_timestamp ON sales_archive(customer_id, timestamp);",
+        "CREATE INDEX IF NOT EXISTS idx_customer_lifetime_total_spent ON customer_lifetime_totals(total_spent);",
+        "CREATE INDEX IF NOT EXISTS idx_daily_product_sales_product_day ON daily_product_sales(product_id, day);",
         "CREATE INDEX IF NOT EXISTS idx_products_category_id ON products(category_id);",
         "CREATE INDEX IF NOT EXISTS idx_customers_name ON customers(name);",
         "CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);",
@@ -117,33 +198,60 @@ def optimize_database_indexes():
     ]
 
 # Response compression and optimization
+def _iso(value):
+    return value.isoformat() if value else None
+
 class ResponseOptimizer:
+    """
+    Compact columnar payloads: one list of keys plus one array per column,
+    built straight from Query.with_entities rows. Slow tablets parse this much
+    faster than an array of objects repeating every key.
+    """
     @staticmethod
-    def compress_sales_data(sales_list):
-        """Optimize sales data for faster transmission"""
-        return [
-            {
-                'id': sale.id,
-                'total': sale.total_price,
-                'method': sale.payment_method,
-                'settled': sale.is_settled,
-                'time': sale.timestamp.isoformat() if sale.timestamp else None,
-                'customer': sale.customer_id,
-                'items': len(sale.items) if sale.items else 0
-            }
-            for sale in sales_list
-        ]
+    def columnar(keys, rows, converters=None):
+        """Turn row tuples into {"columns": keys, "count": n, "data": [column arrays]}"""
+        converters = converters or {}
+        columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in keys]
+        for index, key in enumerate(keys):
+            if key in converters:
+                convert = converters[key]
+                columns[index] = [convert(value) for value in columns[index]]
+        return {
+            'columns': list(keys),
+            'count': len(rows),
+            'data': columns
+        }
+
+    @staticmethod
+    def compress_sales_data(rows):
+        """Rows of (id, total_price, payment_method, is_settled, timestamp, room_no, customer_id, items)"""
+        return ResponseOptimizer.columnar(
+            ('id', 'total', 'method', 'settled', 'time', 'room', 'customer', 'items'),
+            rows,
+            {'time': _iso, 'items': lambda items: len(items) if items else 0}
+        )
     
     @staticmethod
-    def compress_product_data(products_list):
-        """Optimize product data for faster transmission"""
-        return [
-            {
-                'id': product.id,
-                'name': product.name,
-                'price': product.price,
-                'stock': product.stock,
-                'category': product.category_id
-            }
-            for product in products_list
-        ]
\ No newline at end of file
+    def compress_product_data(rows):
+        """Rows of (id, name, price, stock, category_id, image_url)"""
+        return ResponseOptimizer.columnar(
+            ('id', 'name', 'price', 'stock', 'category', 'image'),
+            rows
+        )
+
+    @staticmethod
+    def compress_customer_data(rows):
+        """Rows of (id, name, phone, card_number, balance, card_discount)"""
+        return ResponseOptimizer.columnar(
+            ('id', 'name', 'phone', 'card', 'balance', 'discount'),
+            rows
+        )
+
+    @staticmethod
+    def compress_recharge_data(rows):
+        """Rows of (id, customer_id, amount, recharge_date)"""
+        return ResponseOptimizer.columnar(
+            ('id', 'customer', 'amount', 'date'),
+            rows,
+            {'date': _iso}
+        )
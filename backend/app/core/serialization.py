@@ -0,0 +1,158 @@
+"""
+Fast serialization path for list endpoints.
+
+List endpoints select plain column tuples with Query.with_entities, turn them
+into dicts with the row serializers below and return a FastJSONResponse
+directly. Returning a Response skips FastAPI's response_model validation (the
+models stay on the routes for the OpenAPI docs), and rendering uses orjson
+when it is installed.
+
+With ?format=compact the same endpoints return ResponseOptimizer's columnar
+layout instead, selected from the *_COMPACT_COLUMNS sets.
+"""
+
+from typing import Any, Dict, List
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+from ..models.sales import Sale, RechargeTransaction
+from ..models.customer import Customer
+from ..models.product import Product
+from ..models.category import Category
+from ..utils.images import image_variant_urls
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when available, stdlib json otherwise"""
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+def isoformat(value, default=""):
+    return value.isoformat() if value else default
+
+# Column sets selected by list endpoints, in the order the row serializers expect
+SALE_COLUMNS = (
+    Sale.id, Sale.total_price, Sale.payment_method, Sale.is_settled, Sale.timestamp,
+    Sale.room_no, Sale.customer_id, Sale.items, Sale.payments
+)
+
+PRODUCT_COLUMNS = (
+    Product.id, Product.name, Product.description, Product.price, Product.stock,
+    Product.image_url, Product.category_id, Product.created_at, Product.updated_at
+)
+
+CUSTOMER_COLUMNS = (
+    Customer.id, Customer.name, Customer.phone, Customer.rfid_no, Customer.card_number,
+    Customer.balance, Customer.created_at, Customer.updated_at, Customer.card_discount
+)
+
+CATEGORY_COLUMNS = (Category.id, Category.name, Category.created_at, Category.updated_at)
+
+RECHARGE_COLUMNS = (
+    RechargeTransaction.id, RechargeTransaction.customer_id, RechargeTransaction.amount,
+    RechargeTransaction.recharge_date
+)
+
+# Column sets for ?format=compact, in the order ResponseOptimizer expects
+SALE_COMPACT_COLUMNS = (
+    Sale.id, Sale.total_price, Sale.payment_method, Sale.is_settled, Sale.timestamp,
+    Sale.room_no, Sale.customer_id, Sale.items
+)
+
+PRODUCT_COMPACT_COLUMNS = (
+    Product.id, Product.name, Product.price, Product.stock, Product.category_id, Product.image_url
+)
+
+CUSTOMER_COMPACT_COLUMNS = (
+    Customer.id, Customer.name, Customer.phone, Customer.card_number, Customer.balance, Customer.card_discount
+)
+
+RECHARGE_COMPACT_COLUMNS = RECHARGE_COLUMNS
+
+RESPONSE_FORMATS = ("full", "compact")
+
+def check_response_format(response_format: str):
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Must be one of: {list(RESPONSE_FORMATS)}")
+
+def serialize_sales(rows) -> List[Dict[str, Any]]:
+    """Rows of SALE_COLUMNS -> SaleResponse-shaped dicts"""
+    return [
+        {
+            "id": sale_id,
+            "total_price": total_price,
+            "payment_method": payment_method,
+            "is_settled": is_settled,
+            "timestamp": isoformat(timestamp),
+            "room_no": room_no,
+            "customer_id": customer_id,
+            "items": [{"product_id": item["product_id"], "quantity": item["quantity"]} for item in items] if items else [],
+            "payments": payments if payments else []
+        }
+        for sale_id, total_price, payment_method, is_settled, timestamp, room_no, customer_id, items, payments in rows
+    ]
+
+def serialize_products(rows) -> List[Dict[str, Any]]:
+    """Rows of PRODUCT_COLUMNS -> ProductResponse-shaped dicts"""
+    return [
+        {
+            "id": product_id,
+            "name": name,
+            "description": description,
+            "price": price,
+            "stock": stock,
+            "image_url": image_url,
+            "image_variants": image_variant_urls(image_url),
+            "category_id": category_id,
+            "created_at": isoformat(created_at),
+            "updated_at": isoformat(updated_at, None)
+        }
+        for product_id, name, description, price, stock, image_url, category_id, created_at, updated_at in rows
+    ]
+
+def serialize_customers(rows) -> List[Dict[str, Any]]:
+    """Rows of CUSTOMER_COLUMNS -> CustomerResponse-shaped dicts"""
+    return [
+        {
+            "id": customer_id,
+            "name": name,
+            "phone": phone,
+            "rfid_no": rfid_no,
+            "card_number": card_number,
+            "balance": balance,
+            "created_at": isoformat(created_at),
+            "updated_at": isoformat(updated_at, None),
+            "card_discount": card_discount
+        }
+        for customer_id, name, phone, rfid_no, card_number, balance, created_at, updated_at, card_discount in rows
+    ]
+
+def serialize_categories(rows) -> List[Dict[str, Any]]:
+    """Rows of CATEGORY_COLUMNS -> CategoryResponse-shaped dicts"""
+    return [
+        {
+            "id": category_id,
+            "name": name,
+            "created_at": isoformat(created_at),
+            "updated_at": isoformat(updated_at, None)
+        }
+        for category_id, name, created_at, updated_at in rows
+    ]
+
+def serialize_recharges(rows) -> List[Dict[str, Any]]:
+    """Rows of RECHARGE_COLUMNS -> RechargeResponse-shaped dicts"""
+    return [
+        {
+            "id": recharge_id,
+            "customer_id": customer_id,
+            "amount": amount,
+            "recharge_date": isoformat(recharge_date)
+        }
+        for recharge_id, customer_id, amount, recharge_date in rows
+    ]
@@ -0,0 +1,181 @@
+"""
+Static file serving for uploaded images.
+
+Content-addressed files (<sha256>.<ext> and their <sha256>_<variant>.webp
+thumbnails) never change, so they are sent with a year-long immutable
+Cache-Control and terminals fetch each image once. Every file gets a strong
+ETag and Last-Modified for revalidation, and single byte ranges are honoured.
+Where the ASGI server supports the pathsend or zerocopysend extensions the
+file body is handed to the server (sendfile) instead of being read in Python.
+"""
+
+import os
+import re
+from email.utils import parsedate
+from typing import Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+CONTENT_ADDRESSED_FILE = re.compile(r"^[0-9a-f]{64}(_[a-z]+)?\.[a-z0-9]+$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+
+def _etag_values(header: str):
+    """Entity tags listed in If-None-Match / If-Range, weak prefixes removed"""
+    tags = [tag.strip() for tag in header.split(",") if tag.strip()]
+    return [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+def parse_byte_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single "bytes=start-end" range into inclusive (start, end).
+    Returns None when the header should be ignored (malformed or multiple ranges)
+    and raises ValueError when the range cannot be satisfied.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    start, sep, end = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        first = int(start) if start else None
+        last = int(end) if end else None
+    except ValueError:
+        return None
+
+    if first is None:
+        # Suffix range: the last N bytes
+        if last is None:
+            return None
+        if last == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - last, 0), size - 1
+
+    if last is not None and first > last:
+        return None
+    if first >= size:
+        raise ValueError("Unsatisfiable range")
+    return first, size - 1 if last is None else min(last, size - 1)
+
+class UploadFileResponse(FileResponse):
+    """FileResponse that can send a byte range and use the server's sendfile extensions"""
+
+    def __init__(self, *args, byte_range: Optional[Tuple[int, int]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.byte_range = byte_range
+        if byte_range is not None:
+            start, end = byte_range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{self.stat_result.st_size}"
+            self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+        extensions = scope.get("extensions") or {}
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif self.byte_range is None and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+        else:
+            start, end = self.byte_range or (0, self.stat_result.st_size - 1)
+            remaining = end - start + 1
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                if "http.response.zerocopysend" in extensions:
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": file.wrapped,
+                        "offset": start,
+                        "count": remaining,
+                    })
+                else:
+                    await file.seek(start)
+                    more_body = remaining > 0
+                    if not more_body:
+                        await send({"type": "http.response.body", "body": b"", "more_body": False})
+                    while more_body:
+                        chunk = await file.read(min(self.chunk_size, remaining))
+                        remaining -= len(chunk)
+                        more_body = remaining > 0 and len(chunk) > 0
+                        await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        if self.background is not None:
+            await self.background()
+
+class UploadStaticFiles(StaticFiles):
+    """StaticFiles with strong ETags, long-lived caching for content-addressed names and range requests"""
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        filename = os.path.basename(full_path)
+
+        if CONTENT_ADDRESSED_FILE.match(filename):
+            # The name is derived from the content, so it identifies the bytes exactly
+            etag = f'"{os.path.splitext(filename)[0]}"'
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+            cache_control = DEFAULT_CACHE_CONTROL
+
+        headers = {
+            "etag": etag,
+            "cache-control": cache_control,
+            "accept-ranges": "bytes",
+        }
+        response = UploadFileResponse(
+            full_path, status_code=status_code, stat_result=stat_result,
+            method=scope["method"], headers=headers
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        range_header = request_headers.get("range")
+        if range_header and status_code == 200 and self._if_range_matches(response.headers, request_headers):
+            try:
+                byte_range = parse_byte_range(range_header, stat_result.st_size)
+            except ValueError:
+                return Response(
+                    status_code=416,
+                    headers={"content-range": f"bytes */{stat_result.st_size}", "accept-ranges": "bytes"}
+                )
+            if byte_range is not None:
+                return UploadFileResponse(
+                    full_path, stat_result=stat_result, method=scope["method"],
+                    headers=headers, byte_range=byte_range
+                )
+        return response
+
+    def is_not_modified(self, response_headers: Headers, request_headers: Headers) -> bool:
+        """If-None-Match (lists and weak tags included) takes precedence over If-Modified-Since"""
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            etag = response_headers["etag"]
+            return if_none_match.strip() == "*" or etag in _etag_values(if_none_match)
+        return super().is_not_modified(response_headers, request_headers)
+
+    @staticmethod
+    def _if_range_matches(response_headers: Headers, request_headers: Headers) -> bool:
+        """A Range is only honoured when If-Range is absent or still matches the file"""
+        if_range = request_headers.get("if-range")
+        if if_range is None:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('"'):
+            return if_range == response_headers["etag"]
+        return parsedate(if_range) is not None and parsedate(if_range) == parsedate(response_headers["last-modified"])
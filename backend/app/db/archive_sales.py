@@ -0,0 +1,42 @@
+"""
+Move settled sales older than ARCHIVE_AFTER_DAYS from `sales` to `sales_archive`:
+
+    python -m app.db.archive_sales               # uses ARCHIVE_AFTER_DAYS / ARCHIVE_BATCH_SIZE
+    python -m app.db.archive_sales --days 730    # keep two years hot
+
+Safe to run from cron and to interrupt: every batch is its own transaction.
+Reports and rollup rebuilds read both tables, so nothing needs rebuilding afterwards.
+"""
+
+import argparse
+
+from .. import models  # noqa: F401 - registers every table on Base.metadata
+from ..core.config import settings
+from ..services.archive import archive_sales
+from .database import SessionLocal, create_tables
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old settled sales")
+    parser.add_argument("--days", type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                        help=f"Archive settled sales older than this many days (default: {settings.ARCHIVE_AFTER_DAYS})")
+    parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE,
+                        help=f"Sales moved per transaction (default: {settings.ARCHIVE_BATCH_SIZE})")
+    args = parser.parse_args()
+    if args.days < 1:
+        parser.error("--days must be at least 1")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        moved = archive_sales(
+            db, args.days, args.batch_size,
+            on_batch=lambda moved: print(f"📦 Archived {moved} sales so far")
+        )
+        print(f"✅ Archived {moved} sales older than {args.days} days")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,170 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from fastapi import Request
+from typing import Dict, Optional
 from ..core.config import settings
+import hashlib
 import logging
+import threading
+import time
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create database engine
-try:
-    engine = create_engine(
-        settings.DATABASE_URL,
-        connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-    )
-    logger.info(f"Database engine created successfully with URL: {settings.DATABASE_URL}")
-except Exception as e:
-    logger.error(f"Error creating database engine: {e}")
-    # Fallback to SQLite if PostgreSQL is not available
-    logger.info("Falling back to SQLite database")
-    engine = create_engine(
-        "sqlite:///./sql_app.db",
-        connect_args={"check_same_thread": False}
-    )
+def _json_options():
+    """Decode JSON columns (sale items, payments) with orjson when it is installed"""
+    try:
+        import orjson
+    except ImportError:
+        return {}
+    return {"json_deserializer": orjson.loads}
+
+def _create_engine():
+    try:
+        engine = create_engine(
+            settings.DATABASE_URL,
+            connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
+            **_json_options()
+        )
+        logger.info(f"Database engine created successfully with URL: {settings.DATABASE_URL}")
+        return engine
+    except Exception as e:
+        logger.error(f"Error creating database engine: {e}")
+        # Fallback to SQLite if PostgreSQL is not available
+        logger.info("Falling back to SQLite database")
+        return create_engine(
+            "sqlite:///./sql_app.db",
+            connect_args={"check_same_thread": False}
+        )
+
+_engine = None
+
+def get_engine():
+    """
+    Create the database engine on first use rather than at import, so processes
+    spawned on demand (Passenger) don't load the database driver before they
+    have a request that needs it
+    """
+    global _engine
+    if _engine is None:
+        _engine = _create_engine()
+    return _engine
+
+def __getattr__(name):
+    # Keeps `from app.db.database import engine` working
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class LazyEngineSession(Session):
+    """Session that binds to the engine the first time it needs a connection"""
+    def get_bind(self, *args, **kwargs):
+        if self.bind is None:
+            self.bind = get_engine()
+        return super().get_bind(*args, **kwargs)
 
 # Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(class_=LazyEngineSession, autocommit=False, autoflush=False)
 
 # Create Base class for models
 Base = declarative_base()
 
+# Read replica (optional): reports, dashboards and list endpoints read through
+# get_read_db, which falls back to the primary when no DATABASE_READ_URL is set,
+# when the replica cannot be reached, or when the same client has just written
+_read_engine = None
+_replica_down_until = 0.0
+_recent_writes: Dict[str, float] = {}
+_recent_writes_lock = threading.Lock()
+
+def get_read_engine():
+    global _read_engine
+    if _read_engine is None and settings.DATABASE_READ_URL:
+        _read_engine = create_engine(
+            settings.DATABASE_READ_URL,
+            connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_READ_URL else {},
+            pool_pre_ping=True,
+            **_json_options()
+        )
+        logger.info("Read replica engine created")
+    return _read_engine
+
+def client_key(request: Request) -> Optional[str]:
+    """Identify the client session by its bearer token (hashed) for read-after-write routing"""
+    authorization = request.headers.get("authorization", "")
+    if not authorization:
+        return None
+    return hashlib.sha256(authorization.encode()).hexdigest()[:32]
+
+def _record_write(key: str):
+    now = time.monotonic()
+    with _recent_writes_lock:
+        _recent_writes[key] = now
+        if len(_recent_writes) > 10000:
+            cutoff = now - settings.READ_AFTER_WRITE_SECONDS
+            for stale in [k for k, at in _recent_writes.items() if at < cutoff]:
+                del _recent_writes[stale]
+
+def wrote_recently(key: Optional[str]) -> bool:
+    if key is None:
+        return False
+    written_at = _recent_writes.get(key)
+    return written_at is not None and time.monotonic() - written_at < settings.READ_AFTER_WRITE_SECONDS
+
+@event.listens_for(LazyEngineSession, "after_flush")
+def _mark_flush_writes(session, flush_context):
+    session.info["has_writes"] = True
+
+@event.listens_for(LazyEngineSession, "do_orm_execute")
+def _mark_statement_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["has_writes"] = True
+
+@event.listens_for(LazyEngineSession, "after_commit")
+def _remember_client_write(session):
+    # Only committed writes count; the client's next reads go to the primary for a while
+    if session.info.pop("has_writes", False) and session.info.get("client_key"):
+        _record_write(session.info["client_key"])
+
+@event.listens_for(LazyEngineSession, "after_rollback")
+def _forget_rolled_back_writes(session):
+    session.info.pop("has_writes", None)
+
+def open_read_session(key: Optional[str] = None) -> Session:
+    """
+    A session on the read replica, or on the primary when there is no replica,
+    the replica failed recently, or the client key wrote within READ_AFTER_WRITE_SECONDS
+    """
+    global _replica_down_until
+    read_engine = get_read_engine()
+    if read_engine is None or time.monotonic() < _replica_down_until or wrote_recently(key):
+        return SessionLocal()
+
+    db = SessionLocal(bind=read_engine)
+    try:
+        db.connection()
+    except Exception as e:
+        db.close()
+        _replica_down_until = time.monotonic() + settings.READ_REPLICA_RETRY_SECONDS
+        logger.error(f"Read replica unavailable, using the primary for {settings.READ_REPLICA_RETRY_SECONDS}s: {e}")
+        return SessionLocal()
+    db.info["replica"] = True
+    return db
+
 # Dependency to get database session
-def get_db():
+def get_db(request: Request):
     db = SessionLocal()
+    db.info["client_key"] = client_key(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Dependency for read-only endpoints that tolerate replica lag
+def get_read_db(request: Request):
+    db = open_read_session(client_key(request))
     try:
         yield db
     finally:
@@ -41,7 +173,7 @@ def get_db():
 # Create tables
 def create_tables():
     try:
-        Base.metadata.create_all(bind=engine)
+        Base.metadata.create_all(bind=get_engine())
         logger.info("Database tables created successfully")
     except Exception as e:
-        logger.error(f"Error creating database tables: {e}")
\ No newline at end of file
+        logger.error(f"Error creating database tables: {e}")
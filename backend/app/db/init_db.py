@@ -0,0 +1,13 @@
+"""
+Create missing tables without starting the app:
+
+    python -m app.db.init_db
+
+Run this on deploy when CREATE_TABLES_ON_STARTUP is off.
+"""
+
+from .. import models  # noqa: F401 - registers every table on Base.metadata
+from .database import create_tables
+
+if __name__ == "__main__":
+    create_tables()
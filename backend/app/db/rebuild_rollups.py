@@ -0,0 +1,53 @@
+"""
+Backfill (or repair) the rollup tables from the raw sales and recharges:
+
+    python -m app.db.rebuild_rollups                    # every rollup
+    python -m app.db.rebuild_rollups customer_totals    # only the named ones
+
+Each rollup is rebuilt and committed in its own transaction. "ledger" only
+adds the balance ledger history from before the ledger existed and leaves
+existing entries alone.
+"""
+
+import argparse
+
+from .. import models  # noqa: F401 - registers every table on Base.metadata
+from ..services.balance import backfill_balance_ledger
+from ..services.rollups import (
+    rebuild_recharge_rollup, rebuild_pending_totals, rebuild_customer_lifetime_totals,
+    rebuild_product_sales_rollup, rebuild_hourly_sales_rollup
+)
+from .database import SessionLocal, create_tables
+
+ROLLUPS = {
+    "recharges": rebuild_recharge_rollup,
+    "pending_totals": rebuild_pending_totals,
+    "customer_totals": rebuild_customer_lifetime_totals,
+    "product_sales": rebuild_product_sales_rollup,
+    "hourly_sales": rebuild_hourly_sales_rollup,
+    "ledger": backfill_balance_ledger,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild rollup tables from the raw rows")
+    parser.add_argument("rollups", nargs="*", help=f"Rollups to rebuild: {', '.join(ROLLUPS)} (default: all)")
+    args = parser.parse_args()
+    unknown = [name for name in args.rollups if name not in ROLLUPS]
+    if unknown:
+        parser.error(f"unknown rollup: {', '.join(unknown)}")
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        for name in args.rollups or list(ROLLUPS):
+            rows = ROLLUPS[name](db)
+            db.commit()
+            print(f"✅ Rebuilt {name}: {rows} rows")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
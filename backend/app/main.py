@@ -1,6 +1,11 @@
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .core.config import settings
+from .core.serialization import FastJSONResponse
+from .core.compression import CompressionMiddleware
+from .core.static import UploadStaticFiles
+from .core.lazy_routers import LazyRouters
 from .db.database import create_tables
 from .api.auth import router as auth_router
 from .api.products import router as products_router
@@ -9,8 +14,6 @@ from .api.sales import router as sales_router
 from .api.categories import router as categories_router
 from .api.users import router as users_router
 from .api.dashboard import router as dashboard_router
-from .api.reports import router as reports_router
-from .api.settings import router as settings_router
 
 # Create FastAPI instance
 app = FastAPI(
@@ -18,7 +21,8 @@ app = FastAPI(
     version=settings.APP_VERSION,
     description="Backend API for Cafe Revenue Management System",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse
 )
 
 # Configure CORS
@@ -28,12 +32,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Compress JSON/CSV responses for terminals on slow Wi-Fi
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        gzip_level=settings.COMPRESSION_LEVEL,
+        brotli_quality=settings.BROTLI_QUALITY
+    )
+
+# Serve uploaded product images; content-addressed names are cached by terminals for a year
+os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+app.mount("/uploads", UploadStaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
+
 # Create database tables on startup
 @app.on_event("startup")
 async def startup_event():
-    create_tables()
+    if settings.CREATE_TABLES_ON_STARTUP:
+        create_tables()
 
 # Health check endpoint
 @app.get("/")
@@ -56,5 +75,8 @@ app.include_router(products_router, prefix="/products", tags=["Products"])
 app.include_router(customers_router, prefix="/customers", tags=["Customers"])
 app.include_router(sales_router, prefix="/sales", tags=["Sales"])
 app.include_router(categories_router, prefix="/categories", tags=["Categories"])
-app.include_router(reports_router, prefix="/reports", tags=["Reports"])
-app.include_router(settings_router, prefix="/settings", tags=["Settings"])
\ No newline at end of file
+
+# Rarely used areas are imported on their first request to keep cold starts short
+lazy_routers = LazyRouters(app, package=__package__)
+lazy_routers.register(".api.reports", prefix="/reports", tags=["Reports"])
+lazy_routers.register(".api.settings", prefix="/settings", tags=["Settings"])
\ No newline at end of file
@@ -2,7 +2,11 @@ from .user import User
 from .category import Category
 from .product import Product
 from .customer import Customer
-from .sales import Sale, RechargeTransaction
+from .sales import Sale, ArchivedSale, RechargeTransaction
+from .ledger import BalanceLedger
+from .rollup import DailyRechargeTotal, CustomerPendingTotal, CustomerLifetimeTotal, DailyProductSale, HourlySalesTotal
+from .idempotency import IdempotencyRecord
+from .report_job import ReportJob
 
 __all__ = [
     "User",
@@ -10,5 +14,14 @@ __all__ = [
     "Product",
     "Customer",
     "Sale",
-    "RechargeTransaction"
+    "ArchivedSale",
+    "RechargeTransaction",
+    "BalanceLedger",
+    "DailyRechargeTotal",
+    "CustomerPendingTotal",
+    "CustomerLifetimeTotal",
+    "DailyProductSale",
+    "HourlySalesTotal",
+    "IdempotencyRecord",
+    "ReportJob"
 ]
\ No newline at end of file
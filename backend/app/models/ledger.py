@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from ..db.database import Base
+
+class BalanceLedger(Base):
+    __tablename__ = "balance_ledger"
+
+    id = Column(Integer, primary_key=True, index=True)
+    customer_id = Column(Integer, ForeignKey("customers.id", ondelete="CASCADE"), nullable=False)
+    delta = Column(Float, nullable=False)  # negative for debits, positive for credits
+    reason = Column(String(30), nullable=False)  # sale, settlement, batch_settlement, recharge, opening, adjustment
+    sale_id = Column(Integer, nullable=True)  # sales.id, or sales_archive.id once archived
+    recharge_id = Column(Integer, ForeignKey("recharge_transactions.id"), nullable=True)
+    balance_after = Column(Float, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relationship
+    customer = relationship("Customer", backref="ledger_entries", passive_deletes=True)
+
+    __table_args__ = (
+        # Statements read a customer's entries in time order
+        Index("idx_balance_ledger_customer_created", "customer_id", "created_at", "id"),
+    )
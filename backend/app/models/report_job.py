@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime, JSON, ForeignKey
+from sqlalchemy.sql import func
+from ..db.database import Base
+
+class ReportJob(Base):
+    __tablename__ = "report_jobs"
+
+    id = Column(String(32), primary_key=True)
+    report = Column(String(50), nullable=False)
+    params = Column(JSON, default=dict)
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued, running, succeeded, failed, cancelled
+    progress = Column(Float, nullable=False, default=0.0)
+    result = Column(JSON)
+    error = Column(Text)
+    created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Naive UTC, written by the job runner; heartbeat_at moves with every progress update
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
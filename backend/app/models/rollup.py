@@ -0,0 +1,60 @@
+from sqlalchemy import Column, Integer, Float, Date, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from ..db.database import Base
+
+class DailyRechargeTotal(Base):
+    """Recharge amount and count per business day (BUSINESS_TIMEZONE)"""
+    __tablename__ = "daily_recharge_totals"
+
+    day = Column(Date, primary_key=True)
+    total_amount = Column(Float, nullable=False, default=0.0)
+    recharge_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class CustomerPendingTotal(Base):
+    """Open tab per customer: the sum and count of their unsettled sales"""
+    __tablename__ = "customer_pending_totals"
+
+    customer_id = Column(Integer, ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True)
+    pending_total = Column(Float, nullable=False, default=0.0)
+    pending_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class CustomerLifetimeTotal(Base):
+    """Lifetime spend per customer over their settled sales, for top-customer insights"""
+    __tablename__ = "customer_lifetime_totals"
+
+    customer_id = Column(Integer, ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True)
+    total_spent = Column(Float, nullable=False, default=0.0)
+    transaction_count = Column(Integer, nullable=False, default=0)
+    last_purchase_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Top customers by spend: walk the index from the top and stop after LIMIT rows
+        Index("idx_customer_lifetime_total_spent", "total_spent"),
+    )
+
+class DailyProductSale(Base):
+    """Units sold and revenue per product per business day (BUSINESS_TIMEZONE), over settled sales (expanded from Sale.items)"""
+    __tablename__ = "daily_product_sales"
+
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Per-product time series; leaderboards use the (day, product_id) primary key
+        Index("idx_daily_product_sales_product_day", "product_id", "day"),
+    )
+
+class HourlySalesTotal(Base):
+    """Settled sales per hour (naive UTC hour start, by sale time), for the hour-of-day x weekday heatmap"""
+    __tablename__ = "hourly_sales_totals"
+
+    hour_start = Column(DateTime, primary_key=True)
+    sale_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..db.database import Base
@@ -19,6 +19,38 @@ class Sale(Base):
     # Relationship
     customer = relationship("Customer", backref="sales")
 
+    __table_args__ = (
+        # Date-range reports
+        Index("idx_sales_timestamp", "timestamp"),
+        # Customer statements page through a customer's sales in time order
+        Index("idx_sales_customer_timestamp", "customer_id", "timestamp"),
+        # Pending worklist: groups are read in key order, drill-downs by time
+        Index("idx_sales_pending_customer", "is_settled", "customer_id", "timestamp"),
+        Index("idx_sales_pending_room", "is_settled", "room_no", "timestamp"),
+        # Never hand out an id again once its sale has moved to sales_archive
+        {"sqlite_autoincrement": True},
+    )
+
+class ArchivedSale(Base):
+    """Settled sales past ARCHIVE_AFTER_DAYS, moved out of `sales` by app.db.archive_sales (same ids)"""
+    __tablename__ = "sales_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    total_price = Column(Float, nullable=False)
+    payment_method = Column(String(20), nullable=False)
+    is_settled = Column(Boolean, default=True)
+    timestamp = Column(DateTime(timezone=True))
+    room_no = Column(String(20))
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=True)
+    items = Column(JSON)
+    payments = Column(JSON, default=list)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("idx_sales_archive_timestamp", "timestamp"),
+        Index("idx_sales_archive_customer_timestamp", "customer_id", "timestamp"),
+    )
+
 class RechargeTransaction(Base):
     __tablename__ = "recharge_transactions"
 
@@ -28,4 +60,8 @@ class RechargeTransaction(Base):
     recharge_date = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationship
-    customer = relationship("Customer", backref="recharge_transactions")
\ No newline at end of file
+    customer = relationship("Customer", backref="recharge_transactions")
+
+    __table_args__ = (
+        Index("idx_recharge_customer_date", "customer_id", "recharge_date"),
+    )
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""
+Hot/archive split for sales.
+
+Settled sales older than ARCHIVE_AFTER_DAYS are moved, ids unchanged, from
+`sales` to `sales_archive` in batches, so the tables and indexes that every
+live query touches only hold recent and open sales. Live endpoints keep
+reading `sales`; reports and rollup rebuilds read both tables through
+sale_tables / sales_union, and only touch the archive when the range they
+cover reaches back into it.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterable, Optional, Sequence, Tuple, Union
+from sqlalchemy import delete, func, insert, select, text, union_all
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.performance import keyset_time_param
+from ..models.sales import Sale, ArchivedSale
+from ..utils.timezones import business_day_start, business_today, to_database_time
+
+SALE_TABLES = (Sale, ArchivedSale)
+ARCHIVED_COLUMNS = ("id", "total_price", "payment_method", "is_settled", "timestamp", "room_no", "customer_id", "items", "payments")
+
+def archive_reaches(db: Session, since: Union[date, datetime, str]) -> bool:
+    """
+    Whether any archived sale is dated on or after `since`: a date, a 'YYYY-MM-DD'
+    string, or a stored (naive DATABASE_TIMEZONE) timestamp. One index lookup.
+    """
+    newest = db.query(func.max(ArchivedSale.timestamp)).scalar()
+    if newest is None:
+        return False
+    if isinstance(newest, datetime) and newest.tzinfo is not None:
+        newest = to_database_time(newest)
+    since = since.isoformat() if isinstance(since, (date, datetime)) else str(since)
+    # ISO strings order like the values they encode, also between a date and a timestamp
+    return newest.isoformat() >= since
+
+def sale_tables(db: Session, since: Union[date, datetime, str, None] = None) -> Tuple:
+    """The sale tables a read starting at `since` has to cover (both when since is None)"""
+    if since is None or archive_reaches(db, since):
+        return SALE_TABLES
+    return (Sale,)
+
+def sales_union(tables: Sequence, columns: Iterable[str], criteria: Optional[Callable] = None):
+    """
+    Subquery over the named columns of `tables` (UNION ALL). criteria(table)
+    returns the filters for one table; they are applied inside each branch so
+    each table is searched with its own indexes.
+    """
+    columns = list(columns)
+    selects = [
+        select(*(getattr(table, name) for name in columns)).where(*(criteria(table) if criteria else ()))
+        for table in tables
+    ]
+    query = selects[0] if len(selects) == 1 else union_all(*selects)
+    return query.subquery("sale_rows")
+
+def archive_cutoff(days: int) -> datetime:
+    """Start of the business day `days` ago, as stored; settled sales before it get archived"""
+    return business_day_start(business_today() - timedelta(days=days))
+
+def may_reuse_sale_ids(db: Session) -> bool:
+    """
+    Whether a deleted newest sale's id could be handed out again: SQLite reuses
+    max(id) + 1 in a `sales` table created before it had AUTOINCREMENT, and
+    MySQL before 8.0 resets its counter to max(id) + 1 on restart.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        ddl = db.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'sales'")).scalar()
+        return "AUTOINCREMENT" not in (ddl or "").upper()
+    return dialect in ("mysql", "mariadb")
+
+def archive_sales_batch(db: Session, cutoff: datetime, batch_size: int, keep_newest: bool = False) -> int:
+    """
+    Move up to batch_size settled sales older than cutoff, oldest first, into
+    sales_archive. keep_newest leaves the highest id in `sales` so it cannot be
+    reused (see may_reuse_sale_ids). Returns the number moved. Does not commit.
+    """
+    query = db.query(Sale.id).filter(
+        Sale.timestamp < keyset_time_param(db, cutoff),
+        Sale.is_settled == True
+    )
+    if keep_newest:
+        newest_id = db.query(func.max(Sale.id)).scalar()
+        if newest_id is None:
+            return 0
+        query = query.filter(Sale.id < newest_id)
+
+    ids = [sale_id for (sale_id,) in query.order_by(Sale.timestamp).limit(batch_size).all()]
+    if not ids:
+        return 0
+
+    db.execute(insert(ArchivedSale).from_select(
+        list(ARCHIVED_COLUMNS),
+        select(*(getattr(Sale, name) for name in ARCHIVED_COLUMNS)).where(Sale.id.in_(ids))
+    ))
+    db.execute(delete(Sale).where(Sale.id.in_(ids)))
+    return len(ids)
+
+def archive_sales(
+    db: Session,
+    days: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    on_batch: Optional[Callable[[int], None]] = None
+) -> int:
+    """
+    Archive every settled sale older than `days` (ARCHIVE_AFTER_DAYS), committing
+    after each batch so locks on `sales` are short. on_batch(moved so far) is
+    called after every commit. Returns the number moved.
+    """
+    cutoff = archive_cutoff(settings.ARCHIVE_AFTER_DAYS if days is None else days)
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    keep_newest = may_reuse_sale_ids(db)
+    moved = 0
+    while True:
+        try:
+            count = archive_sales_batch(db, cutoff, batch_size, keep_newest)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        if not count:
+            return moved
+        moved += count
+        if on_batch:
+            on_batch(moved)
@@ -0,0 +1,241 @@
+"""
+Atomic customer card balance changes backed by the balance ledger
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Any
+from sqlalchemy import update, select, insert
+from sqlalchemy.orm import Session
+
+from ..models.customer import Customer
+from ..models.ledger import BalanceLedger
+from ..models.sales import RechargeTransaction
+from ..utils.timezones import to_utc_naive, to_database_time
+from .archive import SALE_TABLES
+
+class InsufficientBalanceError(Exception):
+    """Raised when a conditional debit finds less balance than required"""
+    def __init__(self, customer_id: int, balance: Optional[float], amount: float):
+        self.customer_id = customer_id
+        self.balance = balance
+        self.amount = amount
+        super().__init__(f"Insufficient balance for customer #{customer_id}")
+
+def _apply_balance_change(db: Session, customer_id: int, delta: float, require_funds: bool) -> Optional[float]:
+    """
+    Apply delta to a customer's balance with a single UPDATE and return the new balance.
+    When require_funds is set the UPDATE only matches if balance >= -delta, so
+    concurrent debits can never overdraw the card. Returns None if no row matched.
+    """
+    statement = update(Customer).where(Customer.id == customer_id)
+    if require_funds:
+        statement = statement.where(Customer.balance >= -delta)
+    statement = statement.values(balance=Customer.balance + delta).execution_options(synchronize_session=False)
+
+    if db.get_bind().dialect.update_returning:
+        row = db.execute(statement.returning(Customer.balance)).first()
+        return row[0] if row else None
+
+    # MySQL has no UPDATE ... RETURNING; the row lock taken by the UPDATE keeps
+    # the follow-up read consistent within this transaction
+    result = db.execute(statement)
+    if result.rowcount == 0:
+        return None
+    return db.execute(select(Customer.balance).where(Customer.id == customer_id)).scalar_one()
+
+def _current_balance(db: Session, customer_id: int) -> Optional[float]:
+    return db.execute(select(Customer.balance).where(Customer.id == customer_id)).scalar()
+
+def debit_balance(
+    db: Session,
+    customer_id: int,
+    amount: float,
+    reason: str,
+    sale_id: Optional[int] = None
+) -> float:
+    """Atomically deduct amount from a card and record it in the ledger. Does not commit."""
+    new_balance = _apply_balance_change(db, customer_id, -amount, require_funds=True)
+    if new_balance is None:
+        raise InsufficientBalanceError(customer_id, _current_balance(db, customer_id), amount)
+
+    db.add(BalanceLedger(
+        customer_id=customer_id,
+        delta=-amount,
+        reason=reason,
+        sale_id=sale_id,
+        balance_after=new_balance
+    ))
+    return new_balance
+
+def credit_balance(
+    db: Session,
+    customer_id: int,
+    amount: float,
+    reason: str,
+    recharge_id: Optional[int] = None
+) -> float:
+    """Atomically add amount to a card and record it in the ledger. Does not commit."""
+    new_balance = _apply_balance_change(db, customer_id, amount, require_funds=False)
+    if new_balance is None:
+        raise ValueError(f"Customer #{customer_id} not found")
+
+    db.add(BalanceLedger(
+        customer_id=customer_id,
+        delta=amount,
+        reason=reason,
+        recharge_id=recharge_id,
+        balance_after=new_balance
+    ))
+    return new_balance
+
+def adjust_balance(db: Session, customer_id: int, delta: float, reason: str = "adjustment") -> float:
+    """
+    Atomically apply a manual correction (either sign, no funds check) and record
+    it in the ledger. Does not commit.
+    """
+    new_balance = _apply_balance_change(db, customer_id, delta, require_funds=False)
+    if new_balance is None:
+        raise ValueError(f"Customer #{customer_id} not found")
+
+    db.add(BalanceLedger(
+        customer_id=customer_id,
+        delta=delta,
+        reason=reason,
+        balance_after=new_balance
+    ))
+    return new_balance
+
+def record_balance_entry(db: Session, customer_id: int, delta: float, reason: str, balance_after: float):
+    """Record a balance change that was applied directly (opening balance, manual adjustment). Does not commit."""
+    db.add(BalanceLedger(
+        customer_id=customer_id,
+        delta=delta,
+        reason=reason,
+        balance_after=balance_after
+    ))
+
+def debit_sales_batch(db: Session, customer_id: int, charges: List[Dict[str, Any]], reason: str) -> float:
+    """
+    Atomically deduct the sum of several sale charges ([{"sale_id", "amount"}], in order)
+    from one card and write one ledger entry per sale. Does not commit.
+    """
+    total = sum(charge["amount"] for charge in charges)
+    new_balance = _apply_balance_change(db, customer_id, -total, require_funds=True)
+    if new_balance is None:
+        raise InsufficientBalanceError(customer_id, _current_balance(db, customer_id), total)
+
+    # Walk backwards from the final balance to get the balance after each sale
+    entries = []
+    balance_after = new_balance
+    for charge in reversed(charges):
+        entries.append({
+            "customer_id": customer_id,
+            "delta": -charge["amount"],
+            "reason": reason,
+            "sale_id": charge["sale_id"],
+            "balance_after": balance_after
+        })
+        balance_after += charge["amount"]
+    entries.reverse()
+
+    db.execute(insert(BalanceLedger), entries)
+    return new_balance
+
+def _settled_at(sale_timestamp: Optional[datetime], payments) -> Optional[datetime]:
+    """When a card sale was charged: its settlement record's time, else the sale's own timestamp"""
+    for record in reversed(payments or []):
+        if record.get("method") == "card" and record.get("settled_at"):
+            return to_database_time(datetime.fromtimestamp(record["settled_at"], timezone.utc))
+    return sale_timestamp
+
+def backfill_balance_ledger(db: Session) -> int:
+    """
+    Write ledger rows for card balance changes made before the ledger existed:
+    every recharge and settled card sale (hot and archived) with no ledger row
+    that is older than the customer's first ledger entry, preceded by an
+    "opening" row so the running balance_after reconciles with the balance the
+    ledger starts from (the current balance if the customer has no entries).
+    Sales are entered at their list price since the discount applied at the
+    time was not recorded; the opening row absorbs the difference. Safe to run
+    again: customers whose first entry is an opening row are skipped. Returns
+    the number of rows written. Does not commit.
+    """
+    history: Dict[int, List[Dict[str, Any]]] = {}
+
+    recharges = db.query(
+        RechargeTransaction.id, RechargeTransaction.customer_id, RechargeTransaction.amount, RechargeTransaction.recharge_date
+    ).outerjoin(
+        BalanceLedger, BalanceLedger.recharge_id == RechargeTransaction.id
+    ).filter(BalanceLedger.id.is_(None))
+    for recharge_id, customer_id, amount, recharge_date in recharges.yield_per(1000):
+        history.setdefault(customer_id, []).append({
+            "delta": amount, "reason": "recharge", "recharge_id": recharge_id, "created_at": recharge_date
+        })
+
+    for table in SALE_TABLES:
+        sales = db.query(
+            table.id, table.customer_id, table.total_price, table.timestamp, table.payments
+        ).outerjoin(
+            BalanceLedger, BalanceLedger.sale_id == table.id
+        ).filter(
+            table.payment_method == "card",
+            table.is_settled == True,
+            table.customer_id.isnot(None),
+            BalanceLedger.id.is_(None)
+        )
+        for sale_id, customer_id, total_price, timestamp, payments in sales.yield_per(1000):
+            history.setdefault(customer_id, []).append({
+                "delta": -total_price, "reason": "sale", "sale_id": sale_id,
+                "created_at": _settled_at(timestamp, payments)
+            })
+
+    written = 0
+    for customer_id, balance, customer_created_at in db.query(Customer.id, Customer.balance, Customer.created_at).all():
+        first = db.query(
+            BalanceLedger.created_at, BalanceLedger.delta, BalanceLedger.reason, BalanceLedger.balance_after
+        ).filter(
+            BalanceLedger.customer_id == customer_id
+        ).order_by(BalanceLedger.created_at, BalanceLedger.id).first()
+
+        changes = [change for change in history.get(customer_id, []) if change["created_at"] is not None]
+        if first is not None:
+            if first.reason == "opening":
+                continue
+            # Anything newer than the first entry was written by the ledger itself
+            first_at = to_utc_naive(first.created_at)
+            changes = [change for change in changes if to_utc_naive(change["created_at"]) < first_at]
+            starting_balance = first.balance_after - first.delta
+        else:
+            starting_balance = balance or 0.0
+        if not changes and not starting_balance:
+            continue
+
+        changes.sort(key=lambda change: (to_utc_naive(change["created_at"]), change.get("sale_id") or change.get("recharge_id")))
+        opening = starting_balance - sum(change["delta"] for change in changes)
+        opened_at = customer_created_at or (first.created_at if first is not None else None)
+        if opened_at is None:
+            opened_at = to_database_time(datetime.now(timezone.utc))
+        if changes and to_utc_naive(changes[0]["created_at"]) < to_utc_naive(opened_at):
+            opened_at = changes[0]["created_at"]
+        if first is not None and to_utc_naive(opened_at) >= to_utc_naive(first.created_at):
+            # The opening row has a higher id than the first entry, so it must sort strictly before it
+            opened_at = first.created_at - timedelta(seconds=1)
+
+        # Rows are inserted oldest first so ids follow the (created_at, id) order statements page by
+        running = opening
+        entries = [{"customer_id": customer_id, "delta": opening, "reason": "opening",
+                    "sale_id": None, "recharge_id": None, "balance_after": opening, "created_at": opened_at}]
+        for change in changes:
+            running += change["delta"]
+            entries.append({
+                "customer_id": customer_id,
+                "delta": change["delta"],
+                "reason": change["reason"],
+                "sale_id": change.get("sale_id"),
+                "recharge_id": change.get("recharge_id"),
+                "balance_after": running,
+                "created_at": change["created_at"]
+            })
+        db.execute(insert(BalanceLedger), entries)
+        written += len(entries)
+    return written
@@ -0,0 +1,173 @@
+"""
+Period-over-period sales comparison: the current period, the one before it
+and the same period a year earlier, aggregated in one conditional-aggregation
+query over the union of the three ranges
+"""
+
+import calendar
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import Session
+
+from ..core.performance import keyset_time_param
+from .archive import sale_tables, sales_union
+from ..utils.timezones import business_day_start, business_today
+
+PERIOD_OPTIONS = ("day", "week", "month", "custom")
+COMPARED_PERIODS = ("current", "previous", "last_year")
+
+DateRange = Tuple[date, date]
+
+def shift_months(day: date, months: int) -> date:
+    """Same day of month `months` earlier/later, clamped to the end of shorter months"""
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    return date(year, month + 1, min(day.day, calendar.monthrange(year, month + 1)[1]))
+
+def resolve_periods(
+    period: str,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None
+) -> Dict[str, DateRange]:
+    """
+    The three (from, to) ranges to compare, inclusive. Without explicit dates,
+    day/week/month mean today, this week (from Monday) and this month up to today,
+    compared against the same span of the previous day/week/month. Explicit dates
+    are compared against the equally long range just before them.
+    """
+    if from_date and to_date:
+        period = "custom"
+    elif period == "custom":
+        raise ValueError("from and to are required for a custom period")
+    else:
+        to_date = business_today()
+        if period == "week":
+            from_date = to_date - timedelta(days=to_date.weekday())
+        elif period == "month":
+            from_date = to_date.replace(day=1)
+        else:
+            from_date = to_date
+    if from_date > to_date:
+        raise ValueError("from must not be after to")
+
+    if period == "month":
+        previous = (shift_months(from_date, -1), shift_months(to_date, -1))
+    else:
+        step = timedelta(days=7 if period == "week" else (to_date - from_date).days + 1)
+        previous = (from_date - step, to_date - step)
+
+    return {
+        "current": (from_date, to_date),
+        "previous": previous,
+        "last_year": (shift_months(from_date, -12), shift_months(to_date, -12)),
+    }
+
+def _pct_change(current: float, base: float) -> Optional[float]:
+    if not base:
+        return None
+    return round((current - base) / base * 100, 2)
+
+def _change(current: float, base: float) -> Dict[str, Any]:
+    return {"delta": round(current - base, 2), "percent": _pct_change(current, base)}
+
+def _summarize(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Headline numbers and payment mix of one period from its (payment_method, is_settled) rows"""
+    settled = [row for row in rows if row["is_settled"] and row["count"]]
+    revenue = sum(row["amount"] for row in settled)
+    transactions = sum(row["count"] for row in settled)
+    pending = [row for row in rows if not row["is_settled"]]
+
+    payment_mix = {}
+    for row in sorted(settled, key=lambda row: row["amount"], reverse=True):
+        payment_mix[row["payment_method"]] = {
+            "transaction_count": row["count"],
+            "total_amount": round(row["amount"], 2),
+            "percentage_of_total": round(row["amount"] / revenue * 100, 2) if revenue else 0
+        }
+
+    return {
+        "revenue": round(revenue, 2),
+        "transactions": transactions,
+        "average_order_value": round(revenue / transactions, 2) if transactions else 0,
+        "pending_amount": round(sum(row["amount"] for row in pending), 2),
+        "pending_count": sum(row["count"] for row in pending),
+        "payment_mix": payment_mix
+    }
+
+def _compare(current: Dict[str, Any], base: Dict[str, Any]) -> Dict[str, Any]:
+    changes = {
+        key: _change(current[key], base[key])
+        for key in ("revenue", "transactions", "average_order_value", "pending_amount")
+    }
+    changes["payment_mix"] = {}
+    for method in sorted(set(current["payment_mix"]) | set(base["payment_mix"])):
+        now = current["payment_mix"].get(method, {"transaction_count": 0, "total_amount": 0, "percentage_of_total": 0})
+        then = base["payment_mix"].get(method, {"transaction_count": 0, "total_amount": 0, "percentage_of_total": 0})
+        changes["payment_mix"][method] = {
+            "total_amount": _change(now["total_amount"], then["total_amount"]),
+            "transaction_count": _change(now["transaction_count"], then["transaction_count"]),
+            # Change in share of revenue, in percentage points
+            "share_points": round(now["percentage_of_total"] - then["percentage_of_total"], 2)
+        }
+    return changes
+
+def compare_periods(db: Session, periods: Dict[str, DateRange]) -> Dict[str, Any]:
+    """
+    Totals for every period plus changes against the previous period and last year.
+    Each period is a timestamp range on the sales timestamp index (and the archive's,
+    when the earliest period reaches it); one GROUP BY (payment_method, is_settled)
+    with a CASE per period and measure covers all three.
+    """
+    bounds = {
+        name: (
+            keyset_time_param(db, business_day_start(from_date)),
+            keyset_time_param(db, business_day_start(to_date + timedelta(days=1)))
+        )
+        for name, (from_date, to_date) in periods.items()
+    }
+    earliest = business_day_start(min(from_date for from_date, _ in periods.values()))
+
+    def in_periods(timestamp):
+        return {name: and_(timestamp >= start, timestamp < end) for name, (start, end) in bounds.items()}
+
+    # Last year's range is usually archived: read both tables when it is
+    sales = sales_union(
+        sale_tables(db, earliest),
+        ("payment_method", "is_settled", "timestamp", "total_price"),
+        lambda table: (or_(*in_periods(table.timestamp).values()),)
+    )
+    in_period = in_periods(sales.c.timestamp)
+
+    columns = []
+    for name in COMPARED_PERIODS:
+        columns.append(func.sum(case((in_period[name], 1), else_=0)).label(f"{name}_count"))
+        columns.append(func.sum(case((in_period[name], sales.c.total_price), else_=0)).label(f"{name}_amount"))
+
+    rows = db.query(sales.c.payment_method, sales.c.is_settled, *columns).group_by(
+        sales.c.payment_method, sales.c.is_settled
+    ).all()
+
+    totals = {}
+    for name in COMPARED_PERIODS:
+        totals[name] = _summarize([
+            {
+                "payment_method": row.payment_method,
+                "is_settled": bool(row.is_settled),
+                "count": int(getattr(row, f"{name}_count") or 0),
+                "amount": float(getattr(row, f"{name}_amount") or 0)
+            }
+            for row in rows
+        ])
+
+    return {
+        "periods": {
+            name: {"from": from_date.isoformat(), "to": to_date.isoformat()}
+            for name, (from_date, to_date) in periods.items()
+        },
+        **totals,
+        "changes": {
+            "vs_previous": _compare(totals["current"], totals["previous"]),
+            "vs_last_year": _compare(totals["current"], totals["last_year"])
+        }
+    }
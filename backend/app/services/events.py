@@ -0,0 +1,85 @@
+"""
+In-process event broadcaster for the live dashboard stream.
+
+Write paths publish small events after they commit; each connected
+/dashboard/stream client has a bounded queue that the endpoint drains. Events
+only reach clients connected to the same worker process. Event ids carry a
+per-process prefix, so a client reconnecting to another worker (or after a
+restart) gets a fresh snapshot instead of a wrong replay.
+"""
+
+import asyncio
+import itertools
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional, Set
+
+# Events kept for clients that reconnect with Last-Event-ID
+REPLAY_BUFFER_SIZE = 200
+SUBSCRIBER_QUEUE_SIZE = 100
+
+class EventBroadcaster:
+    def __init__(self):
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._recent: deque = deque(maxlen=REPLAY_BUFFER_SIZE)
+        self._ids = itertools.count(1)
+        self._process_token = uuid.uuid4().hex[:8]
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def events_since(self, last_event_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Buffered events after last_event_id, or None when they cannot be replayed
+        (the id is from another process or older events were already dropped)
+        """
+        token, _, seq = last_event_id.partition("-")
+        if token != self._process_token or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if not self._recent:
+            return []
+        if seq < self._recent[0]["seq"] - 1:
+            return None
+        return [event for event in self._recent if event["seq"] > seq]
+
+    def publish(self, event_type: str, data: Dict[str, Any]):
+        """Queue an event for every subscriber. Call only after the change has committed."""
+        seq = next(self._ids)
+        event = {"id": f"{self._process_token}-{seq}", "seq": seq, "type": event_type, "data": data}
+        self._recent.append(event)
+        if not self._subscribers:
+            return
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._deliver(event)
+        elif self._loop is not None and not self._loop.is_closed():
+            # Published from a worker thread (sync endpoint or background task)
+            self._loop.call_soon_threadsafe(self._deliver, event)
+
+    def _deliver(self, event: Dict[str, Any]):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A client that cannot keep up is told to reload instead of blocking writers
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"id": event["id"], "seq": event["seq"], "type": "resync", "data": {}})
+
+broadcaster = EventBroadcaster()
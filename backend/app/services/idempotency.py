@@ -0,0 +1,91 @@
+"""
+Idempotency-Key support for POS write endpoints.
+
+The stored response is written in the same transaction as the sale or
+recharge it describes, so a retry either finds the committed result or finds
+nothing and nothing was committed.
+"""
+
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Any
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models.idempotency import IdempotencyRecord
+
+MAX_KEY_LENGTH = 100
+PURGE_INTERVAL_SECONDS = 600
+
+_last_purge = 0.0
+
+def request_fingerprint(payload: Any) -> str:
+    """Stable hash of the request body, used to reject a key reused for a different request"""
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+def _cutoff() -> datetime:
+    # Compare as naive UTC; server_default timestamps are UTC on SQLite and normalized elsewhere
+    return datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS)
+
+def _is_expired(record: IdempotencyRecord) -> bool:
+    created_at = record.created_at
+    if created_at is None:
+        return False
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return created_at < _cutoff()
+
+def validate_key(key: str):
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+def get_stored_response(db: Session, key: str, endpoint: str, fingerprint: str) -> Optional[JSONResponse]:
+    """Return the stored response for a repeated key, or None if the request should run"""
+    record = db.get(IdempotencyRecord, (key, endpoint))
+    if record is None:
+        return None
+
+    if _is_expired(record):
+        db.delete(record)
+        db.commit()
+        return None
+
+    if record.request_hash != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key has already been used for a different request"
+        )
+
+    print(f"🔁 Replaying stored response for Idempotency-Key {key} on {endpoint}")
+    return JSONResponse(
+        content=json.loads(record.response_body),
+        status_code=record.status_code,
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+def save_response(db: Session, key: str, endpoint: str, fingerprint: str, status_code: int, body: Any):
+    """Store the response for key alongside the current transaction. Does not commit."""
+    db.add(IdempotencyRecord(
+        key=key,
+        endpoint=endpoint,
+        request_hash=fingerprint,
+        status_code=status_code,
+        response_body=json.dumps(jsonable_encoder(body))
+    ))
+    _purge_expired(db)
+
+def _purge_expired(db: Session):
+    """Drop expired keys at most once every PURGE_INTERVAL_SECONDS per process"""
+    global _last_purge
+    now = time.time()
+    if now - _last_purge < PURGE_INTERVAL_SECONDS:
+        return
+    _last_purge = now
+    db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.created_at < _cutoff()))
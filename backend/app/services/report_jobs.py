@@ -0,0 +1,209 @@
+"""
+Background report jobs.
+
+A job row is committed as `queued` and handed to a small thread pool in the
+process that accepted it, so a long report never holds a request worker. The
+runner reports progress through JobContext, which also notices cancellation.
+Job state lives in the database, so any worker process can answer status
+requests. Finished results are kept for REPORT_JOB_RETENTION_HOURS.
+"""
+
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..db.database import SessionLocal, open_read_session
+from ..models.report_job import ReportJob
+
+ACTIVE_STATUSES = ("queued", "running")
+PROGRESS_INTERVAL_SECONDS = 1.0
+PURGE_INTERVAL_SECONDS = 600
+
+# runner(db, params, job) -> JSON-serialisable result
+ReportRunner = Callable[[Session, Any, "JobContext"], Any]
+
+class JobCancelled(Exception):
+    pass
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class JobContext:
+    """Passed to report runners to publish progress and stop early when the job is cancelled"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._last_write = 0.0
+
+    def progress(self, fraction: float, force: bool = False):
+        """
+        Record progress (0..1), at most once per PROGRESS_INTERVAL_SECONDS unless
+        forced. Raises JobCancelled once the job is no longer running.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_write < PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_write = now
+
+        db = SessionLocal()
+        try:
+            updated = db.execute(
+                update(ReportJob).where(
+                    ReportJob.id == self.job_id,
+                    ReportJob.status == "running"
+                ).values(progress=min(max(fraction, 0.0), 1.0), heartbeat_at=_utcnow())
+            ).rowcount
+            db.commit()
+        finally:
+            db.close()
+        if not updated:
+            raise JobCancelled()
+
+class ReportJobQueue:
+    def __init__(self):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(1, settings.REPORT_JOB_WORKERS),
+                    thread_name_prefix="report-job"
+                )
+            return self._executor
+
+    def submit(self, db: Session, report: str, params: Any, runner: ReportRunner, user_id: Optional[int]) -> ReportJob:
+        """Store a queued job and schedule it; the job only starts after the row is committed"""
+        self._purge_expired(db)
+        job = ReportJob(
+            id=uuid.uuid4().hex,
+            report=report,
+            params=jsonable_encoder(params),
+            status="queued",
+            progress=0.0,
+            created_by=user_id,
+            heartbeat_at=_utcnow()
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        self._get_executor().submit(self._run, job.id, params, runner)
+        print(f"🧾 Report job {job.id} queued: {report}")
+        return job
+
+    def _finish(self, job_id: str, status: str, from_statuses=("running",), **values) -> bool:
+        db = SessionLocal()
+        try:
+            now = _utcnow()
+            updated = db.execute(
+                update(ReportJob).where(
+                    ReportJob.id == job_id,
+                    ReportJob.status.in_(from_statuses)
+                ).values(
+                    status=status,
+                    finished_at=now,
+                    heartbeat_at=now,
+                    expires_at=now + timedelta(hours=settings.REPORT_JOB_RETENTION_HOURS),
+                    **values
+                )
+            ).rowcount
+            db.commit()
+            return bool(updated)
+        finally:
+            db.close()
+
+    def _run(self, job_id: str, params: Any, runner: ReportRunner):
+        state_db = SessionLocal()
+        try:
+            now = _utcnow()
+            started = state_db.execute(
+                update(ReportJob).where(
+                    ReportJob.id == job_id,
+                    ReportJob.status == "queued"
+                ).values(status="running", started_at=now, heartbeat_at=now)
+            ).rowcount
+            state_db.commit()
+        finally:
+            state_db.close()
+        if not started:
+            return  # cancelled while queued
+
+        job = JobContext(job_id)
+        report_db = open_read_session()
+        started_at = time.time()
+        try:
+            result = runner(report_db, params, job)
+            if self._finish(job_id, "succeeded", progress=1.0, result=jsonable_encoder(result)):
+                print(f"✅ Report job {job_id} finished in {time.time() - started_at:.1f}s")
+        except JobCancelled:
+            print(f"🛑 Report job {job_id} cancelled")
+        except HTTPException as e:
+            self._finish(job_id, "failed", error=str(e.detail))
+        except Exception as e:
+            traceback.print_exc()
+            self._finish(job_id, "failed", error=str(e))
+        finally:
+            report_db.close()
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job. A running report stops at its next progress update."""
+        return self._finish(job_id, "cancelled", from_statuses=ACTIVE_STATUSES)
+
+    def get(self, db: Session, job_id: str) -> Optional[ReportJob]:
+        """
+        The job, or None if it does not exist or its result has expired. A job that
+        stopped reporting progress (its process was restarted) is marked failed.
+        """
+        job = db.get(ReportJob, job_id)
+        if job is None:
+            return None
+        now = _utcnow()
+        if job.expires_at is not None and job.expires_at < now:
+            return None
+        if job.status in ACTIVE_STATUSES and job.heartbeat_at is not None and \
+                job.heartbeat_at < now - timedelta(minutes=settings.REPORT_JOB_TIMEOUT_MINUTES):
+            self._finish(job_id, "failed", from_statuses=ACTIVE_STATUSES, error="Job stopped responding (worker restarted?)")
+            db.refresh(job)
+        return job
+
+    def _purge_expired(self, db: Session):
+        """Drop expired jobs at most once every PURGE_INTERVAL_SECONDS per process"""
+        now = time.time()
+        if now - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = now
+        db.execute(delete(ReportJob).where(ReportJob.expires_at < _utcnow()))
+
+def serialize_job(job: ReportJob, include_result: bool = True) -> Dict[str, Any]:
+    def iso(value):
+        return value.isoformat() if value else None
+
+    data = {
+        "id": job.id,
+        "report": job.report,
+        "params": job.params or {},
+        "status": job.status,
+        "progress": round(job.progress or 0.0, 3),
+        "error": job.error,
+        "created_at": iso(job.created_at),
+        "started_at": iso(job.started_at),
+        "finished_at": iso(job.finished_at),
+        "expires_at": iso(job.expires_at)
+    }
+    if include_result and job.status == "succeeded":
+        data["result"] = job.result
+    return data
+
+report_jobs = ReportJobQueue()
@@ -0,0 +1,376 @@
+"""
+Incrementally maintained rollup tables, updated in the same transaction as
+the rows they summarize and rebuildable from the raw tables
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from sqlalchemy import update, insert, delete, func, case, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models.sales import Sale, RechargeTransaction
+from ..models.customer import Customer
+from ..models.product import Product
+from ..utils.timezones import to_utc_naive, to_business_time, business_day_bounds_utc
+from ..models.rollup import DailyRechargeTotal, CustomerPendingTotal, CustomerLifetimeTotal, DailyProductSale, HourlySalesTotal
+from .archive import SALE_TABLES, sales_union
+
+def increment_rollup(
+    db: Session,
+    model,
+    key: Dict[str, Any],
+    increments: Dict[str, Any],
+    maximums: Optional[Dict[str, Any]] = None
+):
+    """
+    Add increments to the rollup row identified by key, creating the row if it
+    does not exist yet. Columns in maximums keep the larger of their current and
+    the given value.
+    """
+    values = {column: getattr(model, column) + value for column, value in increments.items()}
+    for column, value in (maximums or {}).items():
+        current = getattr(model, column)
+        values[column] = case((or_(current.is_(None), current < value), value), else_=current)
+    statement = update(model).filter_by(**key).values(values).execution_options(synchronize_session=False)
+
+    if db.execute(statement).rowcount:
+        return
+
+    try:
+        # Savepoint so a concurrent insert of the same key only undoes this insert
+        with db.begin_nested():
+            db.execute(insert(model).values(**key, **increments, **(maximums or {})))
+    except IntegrityError:
+        db.execute(statement)
+
+def business_date(timestamp) -> date:
+    """The BUSINESS_TIMEZONE day a stored timestamp falls on"""
+    return to_business_time(to_utc_naive(timestamp)).date()
+
+def record_recharge(db: Session, recharge_date: datetime, amount: float):
+    """Add a recharge to the daily recharge rollup. Does not commit."""
+    increment_rollup(
+        db,
+        DailyRechargeTotal,
+        {"day": business_date(recharge_date)},
+        {"total_amount": amount, "recharge_count": 1}
+    )
+
+def rebuild_recharge_rollup(db: Session, batch_size: int = 1000) -> int:
+    """
+    Recompute the daily recharge rollup from recharge_transactions, by business
+    day (grouped here since DATE() would give the stored UTC day). Returns the
+    number of days written.
+    """
+    totals: Dict[date, List] = {}
+    recharges = db.query(RechargeTransaction.recharge_date, RechargeTransaction.amount).filter(
+        RechargeTransaction.recharge_date.isnot(None)
+    ).yield_per(batch_size)
+    for recharge_date, amount in recharges:
+        day = totals.setdefault(business_date(recharge_date), [0.0, 0])
+        day[0] += amount or 0
+        day[1] += 1
+
+    db.execute(delete(DailyRechargeTotal))
+    if totals:
+        db.execute(insert(DailyRechargeTotal), [
+            {"day": day, "total_amount": total_amount, "recharge_count": recharge_count}
+            for day, (total_amount, recharge_count) in totals.items()
+        ])
+    return len(totals)
+
+def period_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+def summarize_recharges(db: Session, from_date: date, to_date: date, granularity: str) -> List[Dict[str, Any]]:
+    """Recharge totals per business day, week (starting Monday) or month, read from the daily rollup"""
+    days = db.query(DailyRechargeTotal).filter(
+        DailyRechargeTotal.day >= from_date,
+        DailyRechargeTotal.day <= to_date
+    ).order_by(DailyRechargeTotal.day).all()
+
+    buckets: Dict[date, Dict[str, Any]] = {}
+    for row in days:
+        period = period_start(row.day, granularity)
+        bucket = buckets.setdefault(period, {"period": period.isoformat(), "total_amount": 0.0, "recharge_count": 0})
+        bucket["total_amount"] += row.total_amount
+        bucket["recharge_count"] += row.recharge_count
+
+    return list(buckets.values())
+
+def record_pending_change(db: Session, customer_id: Optional[int], amount: float, count: int):
+    """
+    Adjust a customer's open tab: (+total, +1) when a pending sale is created,
+    (-total, -1) when it is settled. Sales without a customer are not tracked. Does not commit.
+    """
+    if customer_id is None or not count:
+        return
+    increment_rollup(
+        db,
+        CustomerPendingTotal,
+        {"customer_id": customer_id},
+        {"pending_total": amount, "pending_count": count}
+    )
+
+def get_pending_totals(db: Session, customer_id: int) -> Tuple[float, int]:
+    """(pending_total, pending_count) for a customer, by primary key"""
+    row = db.get(CustomerPendingTotal, customer_id)
+    if row is None:
+        return 0.0, 0
+    return row.pending_total, row.pending_count
+
+def rebuild_pending_totals(db: Session) -> int:
+    """Recompute every customer's open tab from the unsettled sales. Returns the number of customers written."""
+    rows = db.query(
+        Sale.customer_id,
+        func.sum(Sale.total_price).label("pending_total"),
+        func.count(Sale.id).label("pending_count")
+    ).filter(
+        Sale.is_settled == False,
+        Sale.customer_id.isnot(None)
+    ).group_by(Sale.customer_id).all()
+
+    db.execute(delete(CustomerPendingTotal))
+    if rows:
+        db.execute(insert(CustomerPendingTotal), [
+            {
+                "customer_id": row.customer_id,
+                "pending_total": float(row.pending_total or 0),
+                "pending_count": row.pending_count
+            }
+            for row in rows
+        ])
+    return len(rows)
+
+def record_customer_purchases(db: Session, customer_id: Optional[int], amount: float, count: int, last_purchase_at):
+    """
+    Add newly settled sales to a customer's lifetime totals; last_purchase_at is
+    the latest of their sale timestamps. Sales without a customer are not tracked. Does not commit.
+    """
+    if customer_id is None or not count:
+        return
+    increment_rollup(
+        db,
+        CustomerLifetimeTotal,
+        {"customer_id": customer_id},
+        {"total_spent": amount, "transaction_count": count},
+        {"last_purchase_at": last_purchase_at}
+    )
+
+def get_top_customers(db: Session, limit: int) -> List[Dict[str, Any]]:
+    """The customers with the highest lifetime spend, read down the total_spent index"""
+    rows = db.query(
+        CustomerLifetimeTotal.customer_id,
+        Customer.name,
+        CustomerLifetimeTotal.total_spent,
+        CustomerLifetimeTotal.transaction_count,
+        CustomerLifetimeTotal.last_purchase_at
+    ).join(
+        Customer, Customer.id == CustomerLifetimeTotal.customer_id
+    ).filter(
+        CustomerLifetimeTotal.transaction_count > 0
+    ).order_by(CustomerLifetimeTotal.total_spent.desc()).limit(limit).all()
+
+    return [
+        {
+            "id": row.customer_id,
+            "name": row.name,
+            "total_spent": float(row.total_spent or 0),
+            "transaction_count": row.transaction_count or 0,
+            "last_purchase_at": row.last_purchase_at
+        }
+        for row in rows
+    ]
+
+def rebuild_customer_lifetime_totals(db: Session) -> int:
+    """Recompute every customer's lifetime totals from the settled sales, archived ones included. Returns the number of customers written."""
+    sales = sales_union(
+        SALE_TABLES,
+        ("customer_id", "total_price", "timestamp"),
+        lambda table: (table.is_settled == True, table.customer_id.isnot(None))
+    )
+    rows = db.query(
+        sales.c.customer_id,
+        func.sum(sales.c.total_price).label("total_spent"),
+        func.count().label("transaction_count"),
+        func.max(sales.c.timestamp).label("last_purchase_at")
+    ).group_by(sales.c.customer_id).all()
+
+    db.execute(delete(CustomerLifetimeTotal))
+    if rows:
+        db.execute(insert(CustomerLifetimeTotal), [
+            {
+                "customer_id": row.customer_id,
+                "total_spent": float(row.total_spent or 0),
+                "transaction_count": row.transaction_count,
+                "last_purchase_at": row.last_purchase_at
+            }
+            for row in rows
+        ])
+    return len(rows)
+
+def _add_product_lines(totals: Dict[Tuple[date, int], List], timestamp, items):
+    """Accumulate a sale's line items into {(business day, product_id): [quantity, revenue]}"""
+    day = business_date(timestamp)
+    for item in items or []:
+        product_id = item.get("product_id")
+        if product_id is None:
+            continue
+        quantity = item.get("quantity", 0)
+        line = totals.setdefault((day, product_id), [0, 0.0])
+        line[0] += quantity
+        line[1] += item.get("total_price", quantity * item.get("unit_price", 0))
+
+def record_product_sales(db: Session, sales: Iterable[Tuple[Any, List[Dict[str, Any]]]]):
+    """
+    Add newly settled sales, given as (sale timestamp, items), to the daily
+    product rollup with one upsert per day and product. Does not commit.
+    """
+    totals: Dict[Tuple[date, int], List] = {}
+    for timestamp, items in sales:
+        _add_product_lines(totals, timestamp, items)
+
+    for (day, product_id), (quantity, revenue) in totals.items():
+        increment_rollup(
+            db,
+            DailyProductSale,
+            {"day": day, "product_id": product_id},
+            {"quantity": quantity, "revenue": revenue}
+        )
+
+def rebuild_product_sales_rollup(db: Session, batch_size: int = 1000) -> int:
+    """Recompute the daily product rollup from the settled (and archived) sales' items. Returns the number of rows written."""
+    totals: Dict[Tuple[date, int], List] = {}
+    for table in SALE_TABLES:
+        sales = db.query(table.timestamp, table.items).filter(
+            table.is_settled == True,
+            table.timestamp.isnot(None)
+        ).yield_per(batch_size)
+        for timestamp, items in sales:
+            _add_product_lines(totals, timestamp, items)
+
+    db.execute(delete(DailyProductSale))
+    rows = [
+        {"day": day, "product_id": product_id, "quantity": quantity, "revenue": revenue}
+        for (day, product_id), (quantity, revenue) in totals.items()
+    ]
+    for start in range(0, len(rows), batch_size):
+        db.execute(insert(DailyProductSale), rows[start:start + batch_size])
+    return len(rows)
+
+PRODUCT_SORT_OPTIONS = ("revenue", "quantity")
+
+def get_top_products(db: Session, from_date: date, to_date: date, limit: int, order_by: str = "revenue") -> List[Dict[str, Any]]:
+    """Products ranked by revenue or units sold between two business days (inclusive), summed from the daily rollup"""
+    quantity = func.sum(DailyProductSale.quantity).label("quantity")
+    revenue = func.sum(DailyProductSale.revenue).label("revenue")
+    rows = db.query(
+        DailyProductSale.product_id, Product.name, quantity, revenue
+    ).outerjoin(
+        Product, Product.id == DailyProductSale.product_id
+    ).filter(
+        DailyProductSale.day >= from_date,
+        DailyProductSale.day <= to_date
+    ).group_by(
+        DailyProductSale.product_id, Product.name
+    ).order_by(
+        (revenue if order_by == "revenue" else quantity).desc(), DailyProductSale.product_id
+    ).limit(limit).all()
+
+    return [
+        {
+            "product_id": row.product_id,
+            "product_name": row.name or f"Product {row.product_id}",
+            "quantity_sold": int(row.quantity or 0),
+            "total_revenue": float(row.revenue or 0)
+        }
+        for row in rows
+    ]
+
+def get_product_series(db: Session, product_id: int, from_date: date, to_date: date, granularity: str) -> List[Dict[str, Any]]:
+    """A product's units sold and revenue per day, week (starting Monday) or month, read from the daily rollup"""
+    days = db.query(DailyProductSale.day, DailyProductSale.quantity, DailyProductSale.revenue).filter(
+        DailyProductSale.product_id == product_id,
+        DailyProductSale.day >= from_date,
+        DailyProductSale.day <= to_date
+    ).order_by(DailyProductSale.day).all()
+
+    buckets: Dict[date, Dict[str, Any]] = {}
+    for row in days:
+        period = period_start(row.day, granularity)
+        bucket = buckets.setdefault(period, {"period": period.isoformat(), "quantity_sold": 0, "total_revenue": 0.0})
+        bucket["quantity_sold"] += row.quantity
+        bucket["total_revenue"] += row.revenue
+
+    return list(buckets.values())
+
+def utc_hour(timestamp) -> datetime:
+    return to_utc_naive(timestamp).replace(minute=0, second=0, microsecond=0)
+
+def record_hourly_sales(db: Session, sales: Iterable[Tuple[Any, float]]):
+    """Add newly settled sales, given as (sale timestamp, total_price), to the hourly rollup. Does not commit."""
+    totals: Dict[datetime, List] = {}
+    for timestamp, total_price in sales:
+        hour = totals.setdefault(utc_hour(timestamp), [0, 0.0])
+        hour[0] += 1
+        hour[1] += total_price
+
+    for hour_start, (count, revenue) in totals.items():
+        increment_rollup(
+            db,
+            HourlySalesTotal,
+            {"hour_start": hour_start},
+            {"sale_count": count, "revenue": revenue}
+        )
+
+def rebuild_hourly_sales_rollup(db: Session, batch_size: int = 1000) -> int:
+    """Recompute the hourly rollup from the settled (and archived) sales. Returns the number of hours written."""
+    totals: Dict[datetime, List] = {}
+    for table in SALE_TABLES:
+        sales = db.query(table.timestamp, table.total_price).filter(
+            table.is_settled == True,
+            table.timestamp.isnot(None)
+        ).yield_per(batch_size)
+        for timestamp, total_price in sales:
+            hour = totals.setdefault(utc_hour(timestamp), [0, 0.0])
+            hour[0] += 1
+            hour[1] += total_price or 0
+
+    db.execute(delete(HourlySalesTotal))
+    rows = [
+        {"hour_start": hour_start, "sale_count": count, "revenue": revenue}
+        for hour_start, (count, revenue) in totals.items()
+    ]
+    for start in range(0, len(rows), batch_size):
+        db.execute(insert(HourlySalesTotal), rows[start:start + batch_size])
+    return len(rows)
+
+def get_sales_heatmap(db: Session, from_date: date, to_date: date) -> Dict[str, List[List]]:
+    """
+    Transactions and revenue as 7 x 24 matrices (Monday first, hours 0-23) in the
+    business timezone, for business days from_date through to_date. Reads at most
+    one rollup row per hour of the range. In zones offset by a fraction of an hour,
+    each UTC hour is placed at the local hour it starts in.
+    """
+    start, end = business_day_bounds_utc(from_date, to_date)
+    hours = db.query(HourlySalesTotal.hour_start, HourlySalesTotal.sale_count, HourlySalesTotal.revenue).filter(
+        HourlySalesTotal.hour_start >= start,
+        HourlySalesTotal.hour_start < end
+    ).all()
+
+    transactions = [[0] * 24 for _ in range(7)]
+    revenue = [[0.0] * 24 for _ in range(7)]
+    for row in hours:
+        local = to_business_time(row.hour_start)
+        transactions[local.weekday()][local.hour] += row.sale_count
+        revenue[local.weekday()][local.hour] += row.revenue
+
+    return {
+        "transactions": transactions,
+        "revenue": [[round(amount, 2) for amount in day] for day in revenue]
+    }
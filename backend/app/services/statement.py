@@ -0,0 +1,75 @@
+"""
+Customer statements: the customer's balance ledger, newest first, paged with
+a keyset cursor over (created_at, id). Every card debit, recharge and manual
+entry has a ledger row written in the same transaction as the balance change,
+in the order the changes were applied, so the stored balance_after is the
+running balance and nothing has to be recomputed.
+"""
+
+from typing import Optional, List, Dict, Any
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models.sales import Sale, ArchivedSale
+from ..models.ledger import BalanceLedger
+from ..core.performance import KeysetPaginator
+
+def _describe(row) -> Dict[str, Any]:
+    if row.sale_id is not None:
+        return {
+            "source": "sale",
+            "reference_id": row.sale_id,
+            "description": f"Sale #{row.sale_id} (Room {row.room_no})" if row.room_no else f"Sale #{row.sale_id}"
+        }
+    if row.recharge_id is not None:
+        return {"source": "recharge", "reference_id": row.recharge_id, "description": f"Recharge #{row.recharge_id}"}
+    descriptions = {"opening": "Opening balance", "adjustment": "Balance adjustment"}
+    return {"source": row.reason, "reference_id": row.id, "description": descriptions.get(row.reason, row.reason.replace("_", " ").capitalize())}
+
+def build_statement(
+    db: Session,
+    customer_id: int,
+    current_balance: float,
+    limit: int = 50,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Return one page of a customer's statement, newest first. A page is one range
+    scan of idx_balance_ledger_customer_created however long the history is.
+    History from before the ledger existed is written into it by
+    `python -m app.db.rebuild_rollups ledger`.
+    """
+    query = db.query(
+        BalanceLedger.id,
+        BalanceLedger.created_at,
+        BalanceLedger.delta,
+        BalanceLedger.reason,
+        BalanceLedger.sale_id,
+        BalanceLedger.recharge_id,
+        BalanceLedger.balance_after,
+        func.coalesce(Sale.room_no, ArchivedSale.room_no).label("room_no")
+    ).outerjoin(
+        Sale, Sale.id == BalanceLedger.sale_id
+    ).outerjoin(
+        ArchivedSale, ArchivedSale.id == BalanceLedger.sale_id
+    ).filter(BalanceLedger.customer_id == customer_id)
+
+    page = KeysetPaginator(query, BalanceLedger.created_at, BalanceLedger.id, limit=limit, cursor=cursor).paginate()
+
+    entries: List[Dict[str, Any]] = []
+    for row in page["items"]:
+        entries.append({
+            "type": "credit" if row.delta >= 0 else "debit",
+            **_describe(row),
+            "amount": abs(row.delta),
+            "delta": row.delta,
+            "timestamp": row.created_at.isoformat() if row.created_at else "",
+            "balance_after": round(row.balance_after, 2)
+        })
+
+    return {
+        "customer_id": customer_id,
+        "current_balance": current_balance,
+        "entries": entries,
+        "next_cursor": page["next_cursor"]
+    }
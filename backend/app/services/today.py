@@ -0,0 +1,163 @@
+"""
+Today's headline dashboard numbers: revenue, transaction count, payment split,
+pending amount and recharges.
+
+TodayCounters keeps them in memory. They are loaded from the database on
+first use, again after midnight in BUSINESS_TIMEZONE, and every
+TODAY_COUNTERS_RESYNC_SECONDS so that writes handled by other worker processes
+are picked up; in between, the sales write paths apply their changes after
+each commit.
+"""
+
+import copy
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.performance import keyset_time_param
+from ..db.database import SessionLocal
+from ..models.sales import Sale, RechargeTransaction
+from ..utils.timezones import business_day_start, business_today, to_business_time, to_utc_naive
+
+def query_today_totals(db: Session) -> Dict[str, Any]:
+    """
+    Aggregate today's totals from the database. "Today" is the business day in
+    BUSINESS_TIMEZONE, as in the reports; sales are counted by their sale timestamp.
+    """
+    today = business_today()
+    day_start = keyset_time_param(db, business_day_start(today))
+
+    payment_split = {}
+    revenue = 0.0
+    transactions = 0
+    rows = db.query(
+        Sale.payment_method, func.count(Sale.id), func.coalesce(func.sum(Sale.total_price), 0)
+    ).filter(
+        Sale.timestamp >= day_start,
+        Sale.is_settled == True
+    ).group_by(Sale.payment_method).all()
+    for payment_method, count, amount in rows:
+        payment_split[payment_method] = {"count": count, "amount": float(amount)}
+        revenue += float(amount)
+        transactions += count
+
+    pending_count, pending_amount = db.query(
+        func.count(Sale.id), func.coalesce(func.sum(Sale.total_price), 0)
+    ).filter(Sale.is_settled == False).one()
+
+    recharge_count, recharge_amount = db.query(
+        func.count(RechargeTransaction.id), func.coalesce(func.sum(RechargeTransaction.amount), 0)
+    ).filter(RechargeTransaction.recharge_date >= day_start).one()
+
+    return {
+        "date": today.isoformat(),
+        "revenue": revenue,
+        "transactions": transactions,
+        "payment_split": payment_split,
+        "pending_amount": float(pending_amount),
+        "pending_count": pending_count,
+        "recharge_amount": float(recharge_amount),
+        "recharge_count": recharge_count,
+    }
+
+def _as_date(value) -> Optional[date]:
+    """The business day a stored timestamp falls on"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value) if value else None
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return to_business_time(to_utc_naive(value)).date()
+    return value
+
+class TodayCounters:
+    def __init__(self, resync_seconds: int = 0):
+        self.resync_seconds = resync_seconds
+        self._lock = threading.Lock()
+        self._totals: Optional[Dict[str, Any]] = None
+        self._loaded_at = 0.0
+
+    def _is_current(self) -> bool:
+        if self._totals is None or self._totals["date"] != business_today().isoformat():
+            return False
+        return not self.resync_seconds or time.monotonic() - self._loaded_at < self.resync_seconds
+
+    def rehydrate(self, db: Optional[Session] = None):
+        """Reload every counter from the database"""
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            totals = query_today_totals(db)
+        finally:
+            if own_session:
+                db.close()
+        with self._lock:
+            self._totals = totals
+            self._loaded_at = time.monotonic()
+
+    def snapshot(self, db: Optional[Session] = None) -> Dict[str, Any]:
+        if not self._is_current():
+            self.rehydrate(db)
+        with self._lock:
+            totals = copy.deepcopy(self._totals)
+        for key in ("revenue", "pending_amount", "recharge_amount"):
+            totals[key] = round(totals[key], 2)
+        for split in totals["payment_split"].values():
+            split["amount"] = round(split["amount"], 2)
+        return totals
+
+    def _apply(self, update):
+        """
+        Run update(totals, today) under the lock. Before the first load (or after
+        midnight) there is nothing to update: the next read loads the committed rows.
+        """
+        with self._lock:
+            if self._totals is None:
+                return
+            today = business_today()
+            if self._totals["date"] != today.isoformat():
+                self._totals = None
+                return
+            update(self._totals, today)
+
+    @staticmethod
+    def _add_revenue(totals, payment_method: str, count: int, amount: float):
+        split = totals["payment_split"].setdefault(payment_method, {"count": 0, "amount": 0.0})
+        split["count"] += count
+        split["amount"] += amount
+        totals["transactions"] += count
+        totals["revenue"] += amount
+
+    def record_sale_created(self, total_price: float, payment_method: str, is_settled: bool, timestamp):
+        def update(totals, today):
+            if not is_settled:
+                totals["pending_count"] += 1
+                totals["pending_amount"] += total_price
+            elif _as_date(timestamp) == today:
+                self._add_revenue(totals, payment_method, 1, total_price)
+        self._apply(update)
+
+    def record_sales_settled(self, sales: Iterable[Tuple[float, Any]], payment_method: str):
+        """sales: (total_price, sale timestamp) of each sale that moved from pending to settled"""
+        sales = list(sales)
+
+        def update(totals, today):
+            totals["pending_count"] -= len(sales)
+            totals["pending_amount"] -= sum(total_price for total_price, _ in sales)
+            todays = [total_price for total_price, timestamp in sales if _as_date(timestamp) == today]
+            if todays:
+                self._add_revenue(totals, payment_method, len(todays), sum(todays))
+        self._apply(update)
+
+    def record_recharge(self, amount: float, recharge_date):
+        def update(totals, today):
+            if _as_date(recharge_date) == today:
+                totals["recharge_count"] += 1
+                totals["recharge_amount"] += amount
+        self._apply(update)
+
+today_counters = TodayCounters(resync_seconds=settings.TODAY_COUNTERS_RESYNC_SECONDS)
@@ -0,0 +1,96 @@
+"""
+Pending-sales worklist for the settlement screen: unsettled sales grouped by
+customer or by room, with per-group totals from a GROUP BY and keyset
+pagination over the group key
+"""
+
+import base64
+import json
+from typing import Any, Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models.sales import Sale
+from ..models.customer import Customer
+
+GROUP_BY_OPTIONS = ("customer", "room")
+
+def group_column(group_by: str):
+    return Sale.customer_id if group_by == "customer" else Sale.room_no
+
+def encode_group_cursor(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps([key]).encode()).decode()
+
+def decode_group_cursor(cursor: str, group_by: str):
+    """Return the last group key of the previous page or raise ValueError"""
+    try:
+        key, = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return int(key) if group_by == "customer" else str(key)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def parse_group_key(group_by: str, key: Optional[str]):
+    """Turn the key query parameter into a column value; None selects sales without a customer/room"""
+    if key is None or group_by == "room":
+        return key
+    try:
+        return int(key)
+    except ValueError:
+        raise ValueError("Customer group key must be a customer ID")
+
+def list_pending_groups(db: Session, group_by: str, limit: int = 50, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    One page of pending groups in key order. The pending-sales indexes lead with
+    (is_settled, key), so the database stops after limit + 1 groups instead of
+    aggregating everything outstanding.
+    """
+    column = group_column(group_by)
+    query = db.query(
+        column.label("key"),
+        func.count(Sale.id).label("pending_count"),
+        func.sum(Sale.total_price).label("pending_total"),
+        func.min(Sale.timestamp).label("oldest_sale_at"),
+        func.max(Sale.timestamp).label("latest_sale_at")
+    ).filter(
+        Sale.is_settled == False,
+        column.isnot(None)
+    )
+    if cursor:
+        query = query.filter(column > decode_group_cursor(cursor, group_by))
+
+    rows = query.group_by(column).order_by(column).limit(limit + 1).all()
+    page = rows[:limit]
+
+    customer_names = {}
+    if group_by == "customer" and page:
+        customer_names = dict(
+            db.query(Customer.id, Customer.name).filter(Customer.id.in_([row.key for row in page])).all()
+        )
+
+    groups: List[Dict[str, Any]] = []
+    for row in page:
+        group = {
+            "key": row.key,
+            "pending_count": row.pending_count,
+            "pending_total": float(row.pending_total or 0),
+            "oldest_sale_at": row.oldest_sale_at.isoformat() if row.oldest_sale_at else None,
+            "latest_sale_at": row.latest_sale_at.isoformat() if row.latest_sale_at else None
+        }
+        if group_by == "customer":
+            group["customer_name"] = customer_names.get(row.key)
+        groups.append(group)
+
+    result = {
+        "group_by": group_by,
+        "groups": groups,
+        "next_cursor": encode_group_cursor(page[-1].key) if len(rows) > limit else None
+    }
+
+    # Sales without a customer (or room) are summarised once, on the first page
+    if not cursor:
+        ungrouped_count, ungrouped_total = db.query(
+            func.count(Sale.id), func.coalesce(func.sum(Sale.total_price), 0)
+        ).filter(Sale.is_settled == False, column.is_(None)).one()
+        result["ungrouped"] = {"pending_count": ungrouped_count, "pending_total": float(ungrouped_total)}
+
+    return result
@@ -0,0 +1,142 @@
+import asyncio
+import functools
+import hashlib
+import importlib.util
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, BinaryIO
+
+from ..core.config import settings
+
+CHUNK_SIZE = 64 * 1024
+
+# Allowance for multipart boundaries and part headers when checking Content-Length
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+ALLOWED_IMAGE_TYPES = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+# name -> longest edge in pixels; every variant is stored as WebP
+IMAGE_VARIANTS = {
+    "thumb": 256,
+    "medium": 800,
+}
+
+CONTENT_ADDRESSED_NAME = re.compile(r"^(?P<digest>[0-9a-f]{64})\.(?P<ext>[a-z]+)$")
+
+@functools.lru_cache(maxsize=1)
+def pillow_available() -> bool:
+    """Pillow is optional; without it only the original image is stored"""
+    return importlib.util.find_spec("PIL") is not None
+
+class ImageTooLargeError(Exception):
+    pass
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+    return _process_pool
+
+def store_upload(source: BinaryIO, upload_dir: Path, extension: str, max_bytes: int) -> str:
+    """
+    Copy an upload to disk in chunks while hashing it, and store it as <sha256>.<ext>.
+    Re-uploading the same image reuses the existing file. Returns the stored filename.
+    Blocking; run it in a worker thread.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=upload_dir, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImageTooLargeError()
+                digest.update(chunk)
+                buffer.write(chunk)
+
+        filename = f"{digest.hexdigest()}.{extension}"
+        final_path = upload_dir / filename
+        if final_path.exists():
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, final_path)
+        return filename
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def generate_variants(source_path: str) -> Dict[str, str]:
+    """Write resized WebP variants next to the source image. Runs in the process pool."""
+    if not pillow_available():
+        return {}
+    # Imported here so Pillow is only loaded by the workers that resize images
+    from PIL import Image
+
+    source = Path(source_path)
+    digest = source.stem
+    variants = {}
+    with Image.open(source) as original:
+        original.load()
+        image = original.convert("RGBA") if original.mode in ("P", "LA", "RGBA") else original.convert("RGB")
+        for name, max_edge in IMAGE_VARIANTS.items():
+            filename = f"{digest}_{name}.webp"
+            target = source.parent / filename
+            if not target.exists():
+                variant = image.copy()
+                variant.thumbnail((max_edge, max_edge))
+                temp_target = target.with_suffix(".tmp")
+                variant.save(temp_target, "WEBP", quality=80, method=4)
+                os.replace(temp_target, target)
+            variants[name] = filename
+    return variants
+
+async def create_variants(source_path: Path) -> Dict[str, str]:
+    """Generate variants off the event loop, in the process pool when it is usable"""
+    if not pillow_available():
+        return {}
+
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_process_pool(), generate_variants, str(source_path))
+    except (OSError, RuntimeError) as e:
+        # Process pools are unavailable in some hosting sandboxes; resize in a thread instead
+        print(f"Image process pool unavailable ({e}); generating variants in a thread")
+        return await loop.run_in_executor(None, generate_variants, str(source_path))
+
+def image_variant_urls(image_url: Optional[str]) -> Dict[str, str]:
+    """
+    Variant URLs for a content-addressed product image, e.g.
+    /uploads/products/<sha256>.jpg -> {"thumb": "/uploads/products/<sha256>_thumb.webp", ...}.
+    Images stored under other names have no variants. Checked on disk every time
+    (a stat per variant), since variants can appear after the first lookup.
+    """
+    if not image_url:
+        return {}
+
+    prefix, _, filename = image_url.rpartition("/")
+    match = CONTENT_ADDRESSED_NAME.match(filename)
+    if not match:
+        return {}
+
+    upload_dir = Path(settings.UPLOAD_DIR) / "products"
+    urls = {}
+    for name in IMAGE_VARIANTS:
+        variant = f"{match.group('digest')}_{name}.webp"
+        if (upload_dir / variant).exists():
+            urls[name] = f"{prefix}/{variant}"
+    return urls
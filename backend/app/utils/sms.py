@@ -1,4 +1,3 @@
-import requests
 import os
 from typing import Optional, List, Dict, Any
 from ..core.config import settings
@@ -30,6 +29,9 @@ class SMSService:
         if not phone_number or not message:
             print("Invalid phone number or message")
             return False
+        
+        # requests is imported on first send to keep it out of application startup
+        import requests
             
         try:
             # Format phone number (ensure it starts with 92 for Pakistan)
@@ -102,6 +104,8 @@ class SMSService:
         if not messages:
             print("No messages to send")
             return False
+        
+        import requests
             
         try:
             # Prepare headers
@@ -154,6 +158,35 @@ class SMSService:
             print(f"Error sending bulk SMS: {str(e)}")
             return False
     
+    def send_bulk_sms_batched(self, messages: List[Dict[str, Any]], batch_size: int = 50) -> int:
+        """
+        Send any number of messages through the bulk API, batch_size messages per request.
+        Each message should have 'contact' and 'message' keys; phone numbers are formatted here.
+        Returns the number of messages in batches that were sent successfully
+        """
+        if not self.enabled:
+            print("SMS service not configured - skipping bulk SMS job")
+            return 0
+
+        formatted = [
+            {
+                "contact": self._format_phone_number(message["contact"]),
+                "message": message["message"],
+                "type": message.get("type", "text")
+            }
+            for message in messages
+            if message.get("contact") and message.get("message")
+        ]
+
+        sent = 0
+        for start in range(0, len(formatted), batch_size):
+            batch = formatted[start:start + batch_size]
+            if self.send_bulk_sms(batch):
+                sent += len(batch)
+
+        print(f"Bulk SMS job finished: {sent}/{len(formatted)} messages sent")
+        return sent
+
     def _format_phone_number(self, phone_number: str) -> str:
         """
         Format phone number to international format for Pakistan
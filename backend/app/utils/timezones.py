@@ -0,0 +1,60 @@
+import functools
+import re
+from datetime import date, datetime, time, timedelta, timezone, tzinfo
+
+from ..core.config import settings
+
+UTC_OFFSET = re.compile(r"^(?:UTC)?(?P<sign>[+-])(?P<hours>\d{1,2}):?(?P<minutes>\d{2})?$")
+
+@functools.lru_cache(maxsize=None)
+def get_timezone(name: str) -> tzinfo:
+    """
+    An IANA zone name ("Asia/Karachi") or a fixed offset ("+05:00", "UTC+5").
+    Zone names need the system time zone database (or the tzdata package on Windows),
+    and backports.zoneinfo on Python 3.8.
+    """
+    if name.upper() == "UTC":
+        return timezone.utc
+    match = UTC_OFFSET.match(name)
+    if match:
+        offset = timedelta(hours=int(match["hours"]), minutes=int(match["minutes"] or 0))
+        return timezone(-offset if match["sign"] == "-" else offset)
+    try:
+        from zoneinfo import ZoneInfo
+    except ImportError:  # Python 3.8
+        from backports.zoneinfo import ZoneInfo
+    return ZoneInfo(name)
+
+def business_timezone() -> tzinfo:
+    return get_timezone(settings.BUSINESS_TIMEZONE)
+
+def to_utc_naive(value: datetime) -> datetime:
+    """
+    Normalise a stored timestamp to naive UTC. Naive values are read as
+    DATABASE_TIMEZONE, the zone the database writes its server-default timestamps in.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=get_timezone(settings.DATABASE_TIMEZONE))
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def to_database_time(value: datetime) -> datetime:
+    """Aware datetime -> naive in DATABASE_TIMEZONE, for comparing against stored timestamps"""
+    return value.astimezone(get_timezone(settings.DATABASE_TIMEZONE)).replace(tzinfo=None)
+
+def business_day_start(day: date) -> datetime:
+    """Midnight starting day in the business timezone, as stored (naive DATABASE_TIMEZONE)"""
+    return to_database_time(datetime.combine(day, time.min, tzinfo=business_timezone()))
+
+def business_day_bounds_utc(from_date: date, to_date: date):
+    """[start, end) in naive UTC covering from_date through to_date in the business timezone"""
+    zone = business_timezone()
+    start = datetime.combine(from_date, time.min, tzinfo=zone)
+    end = datetime.combine(to_date + timedelta(days=1), time.min, tzinfo=zone)
+    return to_utc_naive(start), to_utc_naive(end)
+
+def to_business_time(utc_value: datetime) -> datetime:
+    """Naive UTC -> aware datetime in the business timezone"""
+    return utc_value.replace(tzinfo=timezone.utc).astimezone(business_timezone())
+
+def business_today() -> date:
+    return datetime.now(business_timezone()).date()
@@ -0,0 +1,121 @@
+"""
+Cold start benchmark: time from `import app.main` to the first response.
+
+Each run is a fresh interpreter, like a process spawned by Passenger:
+
+    python benchmark_startup.py                 # 5 runs, GET /health
+    python benchmark_startup.py --runs 10 --path /products/
+    python benchmark_startup.py --importtime    # slowest imports (python -X importtime)
+
+The request is sent straight to the ASGI app, so no server or HTTP client is needed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+async def _asgi_get(app, path: str) -> int:
+    """Send one GET through the ASGI app and return the status code"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]["status"]
+
+def run_child(path: str):
+    """Measure a single cold start in this interpreter and print the timings as JSON"""
+    started = time.perf_counter()
+    sys.path.insert(0, BACKEND_DIR)
+    from app.main import app
+    imported = time.perf_counter()
+
+    async def first_request():
+        await app.router.startup()
+        ready = time.perf_counter()
+        status = await _asgi_get(app, path)
+        return ready, status
+
+    ready, status = asyncio.run(first_request())
+    responded = time.perf_counter()
+    print(json.dumps({
+        "import_ms": (imported - started) * 1000,
+        "startup_ms": (ready - imported) * 1000,
+        "first_response_ms": (responded - ready) * 1000,
+        "total_ms": (responded - started) * 1000,
+        "status": status,
+    }))
+
+def show_importtime(limit: int):
+    """Print the slowest imports of app.main by cumulative time"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), module.rstrip()))
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, module in sorted(rows, key=lambda row: row[0], reverse=True)[:limit]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {module}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start time of the API")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/health", help="Path of the first request")
+    parser.add_argument("--importtime", action="store_true", help="Show the slowest imports instead")
+    parser.add_argument("--limit", type=int, default=25, help="Rows shown with --importtime")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.path)
+        return
+    if args.importtime:
+        show_importtime(args.limit)
+        return
+
+    results = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--path", args.path],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"First request: GET {args.path} -> {results[0]['status']} ({args.runs} runs)")
+    for key in ("import_ms", "startup_ms", "first_response_ms", "total_ms"):
+        values = [result[key] for result in results]
+        print(f"{key:>18}: median {statistics.median(values):8.1f}  min {min(values):8.1f}  max {max(values):8.1f}")
+
+if __name__ == "__main__":
+    main()